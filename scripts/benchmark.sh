@@ -0,0 +1,8 @@
+#!/bin/bash
+
+set -euo pipefail
+
+uv sync
+
+# CPUのみ・スタブモデルで前処理/後処理の各ステージを計測する (例: bash scripts/benchmark.sh --durations 60 600 --output bench.json)
+uv run src/backend/benchmark.py "$@"
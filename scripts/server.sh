@@ -0,0 +1,20 @@
+#!/bin/bash
+
+set -euo pipefail
+
+uv sync
+if [[ -n "${HF_TOKEN:-}" ]]; then
+    uv run huggingface-cli login --token "$HF_TOKEN"
+else
+    echo "Warning: HF_TOKEN is not set; skipping huggingface-cli login."
+fi
+
+export PYTHONWARNINGS="ignore::UserWarning" # torchaudioの警告文を非表示
+
+# モデルを一度だけロードし、ジョブを受け付け続ける
+uv run src/backend/server.py \
+    --host "${SERVER_HOST:-127.0.0.1}" \
+    --port "${SERVER_PORT:-8005}" \
+    --preload \
+    --preload_options "{\"asr_model_name\": \"$ASR_MODEL_NAME\", \"diarization_model_name\": \"$DIARIZATION_MODEL_NAME\"}" \
+    "$@"
@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from typing import Any, Callable, List, Tuple
+
+import numpy as np
+import soundfile as sf
+from pyannote.core import Annotation, Segment
+
+from data import AudioInput
+from models.base import BaseModel
+from peaks import compute_peaks
+from transcribe import build_parser, _run_asr_on_segments
+from index_manager import IndexManager
+from utils import add_speaker_info_to_text, merge_sentence, save_transcripts_json
+
+
+def synthesize_audio(
+    duration_sec: float,
+    sr: int,
+    num_speakers: int = 3,
+    seed: int = 0
+) -> Tuple[np.ndarray, List[Tuple[float, float, str]]]:
+    """
+    Generates a mono conversation-like waveform: speaker turns of 1-8 s (one tone per speaker,
+    amplitude-modulated, with a little noise) separated by near-silent gaps of 0.05-5 s, so both
+    silence shrinking (gaps > 2 s) and silence splitting have work to do.
+    return: (float32 waveform, list of (start_sec, end_sec, speaker) turns)
+    """
+    rng = np.random.default_rng(seed)
+    total = int(duration_sec * sr)
+    freqs = [180.0 + 70.0 * k for k in range(num_speakers)]
+    pieces = []
+    turns = []
+    cursor = 0
+    while cursor < total:
+        gap = min(int(rng.uniform(0.05, 5.0) * sr), total - cursor)
+        pieces.append((rng.standard_normal(gap) * 1e-4).astype(np.float32))
+        cursor += gap
+        length = min(int(rng.uniform(1.0, 8.0) * sr), total - cursor)
+        if length <= 0:
+            break
+        k = int(rng.integers(num_speakers))
+        t = np.arange(length, dtype=np.float32) / sr
+        envelope = 0.3 + 0.2 * np.sin(2 * np.pi * rng.uniform(2.0, 5.0) * t)
+        tone = envelope * np.sin(2 * np.pi * freqs[k] * t) + 0.02 * rng.standard_normal(length)
+        pieces.append(tone.astype(np.float32))
+        turns.append((cursor / sr, (cursor + length) / sr, f"SPEAKER_{k:02d}"))
+        cursor += length
+    return np.concatenate(pieces)[:total], turns
+
+
+class StubRecognition(BaseModel):
+    """
+    Deterministic CPU-only ASR stand-in: emits one segment every 60 / segments_per_min seconds,
+    ending a sentence every fourth segment, so downstream stages see realistic segment counts.
+    """
+    def __init__(self, args: Any, segments_per_min: float = 20.0) -> None:
+        super().__init__(args)
+        self.segment_sec = 60.0 / segments_per_min
+
+    def setup_model(self) -> Any:
+        return "stub"
+
+    def inference(self, audio: Any) -> Any:
+        waveform = audio[0] if isinstance(audio, tuple) else audio
+        return len(waveform) / 16000.0, None
+
+    def parse_output(self, raw_output: Any, start_time: Any) -> List[Tuple[Segment, str]]:
+        duration = raw_output
+        segments = []
+        for k, start in enumerate(np.arange(0.0, duration, self.segment_sec)):
+            end = min(start + self.segment_sec, duration)
+            segments.append((Segment(float(start), float(end)), f"word{k}" + ("。" if k % 4 == 3 else "")))
+        return segments
+
+
+def stub_diarization(dataset: AudioInput, waveform: np.ndarray, sr: int, num_speakers: int) -> Annotation:
+    """
+    Deterministic diarization stand-in: every non-silent stretch of the (compressed) waveform is
+    one turn, with speakers assigned round-robin.
+    """
+    silences = dataset._detect_silences(waveform, sr)
+    ann = Annotation()
+    cursor = 0
+    k = 0
+    for start, end in silences + [(len(waveform), len(waveform))]:
+        if start > cursor:
+            ann[Segment(cursor / sr, start / sr)] = f"SPEAKER_{k % num_speakers:02d}"
+            k += 1
+        cursor = end
+    return ann
+
+
+def measure(fn: Callable, repeat: int = 1, trace_memory: bool = True) -> Tuple[Any, dict]:
+    """
+    Runs fn `repeat` times for the best wall time, then once more under tracemalloc for its peak
+    Python/NumPy allocation (tracemalloc slows pure-Python code, so it is kept out of the timings).
+    return: (last result, {"seconds", "peak_alloc_mb"})
+    """
+    best = float("inf")
+    result = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    stats = {"seconds": best}
+    if trace_memory:
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats["peak_alloc_mb"] = peak / 1024 ** 2
+    return result, stats
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux (bytes on macOS); it is the process high-water mark
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_benchmark(args) -> dict:
+    target_sr = 16000
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix="transcriber-bench-")
+    cwd = os.getcwd()
+    try:
+        # save_transcripts_json / IndexManager write relative to the working directory
+        os.chdir(work_dir)
+        os.makedirs("src/frontend/public/audios")
+        audio_dir = os.path.join(work_dir, f"num_speakers_{args.num_speakers}")
+        os.makedirs(audio_dir)
+        dataset = AudioInput(audio_dir, sampling_rate=target_sr, skip_processed=False)
+        run_args = build_parser().parse_args([
+            "--audio_dir", audio_dir,
+            "--asr_batch_size", str(args.asr_batch_size),
+        ])
+        run_args.num_speakers = args.num_speakers
+
+        for duration in args.durations:
+            waveform, _ = synthesize_audio(duration, args.source_sr, args.num_speakers, seed=args.seed)
+            path = os.path.join(audio_dir, f"bench_{int(duration)}s.wav")
+            sf.write(path, waveform, args.source_sr, subtype="PCM_16")
+            del waveform
+
+            # Stage inputs are bound with partial: later iterations rebind (and del) these names
+            stages = {}
+            loaded, stages["load"] = measure(partial(sf.read, path), args.repeat, args.trace_memory)
+            loaded = loaded[0]
+            if args.source_sr != target_sr:
+                from librosa.core import resample as lr_resample
+
+                resampled, stages["resample"] = measure(
+                    partial(lr_resample, loaded, orig_sr=args.source_sr, target_sr=target_sr, axis=0),
+                    args.repeat, args.trace_memory
+                )
+            else:
+                resampled = loaded
+            del loaded
+            _, stages["waveform_peaks"] = measure(
+                partial(compute_peaks, resampled, target_sr), args.repeat, args.trace_memory
+            )
+            compressed, stages["shrink_long_silences"] = measure(
+                partial(dataset._shrink_long_silences, resampled, target_sr, max_silence_sec=2.0),
+                args.repeat, args.trace_memory
+            )
+            chunks, stages["split_by_silence"] = measure(
+                partial(dataset._split_by_silence_candidates, compressed, target_sr),
+                args.repeat, args.trace_memory
+            )
+            ann = stub_diarization(dataset, compressed, target_sr, args.num_speakers)
+            audio_row = {
+                "duration_sec": duration,
+                "compressed_sec": len(compressed) / target_sr,
+                "chunks": len(chunks),
+                "turns": len(ann),
+                "stages": stages,
+            }
+            del resampled, compressed
+
+            for rate in args.segments_per_min:
+                asr_model = StubRecognition(run_args, segments_per_min=rate)
+                text_stages = {}
+                asr_output, text_stages["asr_on_segments"] = measure(
+                    partial(_run_asr_on_segments, asr_model, run_args, chunks, target_sr),
+                    args.repeat, args.trace_memory
+                )
+                spk_text, text_stages["speaker_assignment"] = measure(
+                    partial(add_speaker_info_to_text, asr_output, ann), args.repeat, args.trace_memory
+                )
+                merged, text_stages["merge_sentence"] = measure(
+                    partial(merge_sentence, spk_text), args.repeat, args.trace_memory
+                )
+                basename = os.path.splitext(os.path.basename(path))[0]
+                _, text_stages["save_transcripts_json"] = measure(
+                    partial(save_transcripts_json, run_args, merged, basename), args.repeat, args.trace_memory
+                )
+                # A fresh unbuffered manager per run, so every run pays for one locked, atomic index write
+                _, text_stages["save_index_json"] = measure(
+                    lambda name=os.path.basename(path): IndexManager(flush_interval=0).add(name),
+                    args.repeat, args.trace_memory
+                )
+                row = dict(audio_row, segments_per_min=rate, segments=len(asr_output), merged=len(merged))
+                row["stages"] = dict(audio_row["stages"], **text_stages)
+                row["peak_rss_mb"] = peak_rss_mb()
+                rows.append(row)
+                print_row(row)
+
+            os.remove(path)
+            shutil.rmtree(os.path.join(work_dir, "outputs"), ignore_errors=True)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {"config": vars(args), "rows": rows, "scaling": scaling_exponents(rows)}
+
+
+def scaling_exponents(rows: list) -> dict:
+    """
+    Fits seconds ~ size^k per stage on a log-log scale: k ≈ 1 is linear, k ≈ 2 quadratic.
+    Audio stages are fitted against audio length, text stages against segment count.
+    return: {stage: k}
+    """
+    exponents = {}
+    if len(rows) < 2:
+        return exponents
+    audio_stages = ("load", "resample", "waveform_peaks", "shrink_long_silences", "split_by_silence")
+    for stage in rows[0]["stages"]:
+        size_key = "duration_sec" if stage in audio_stages else "segments"
+        points = {
+            row[size_key]: row["stages"][stage]["seconds"]
+            for row in rows
+            if row[size_key] > 0 and row["stages"][stage]["seconds"] > 0
+        }
+        if len(points) >= 2:
+            sizes = np.log(np.array(list(points.keys()), dtype=np.float64))
+            seconds = np.log(np.array(list(points.values()), dtype=np.float64))
+            exponents[stage] = float(np.polyfit(sizes, seconds, 1)[0])
+    return exponents
+
+
+def print_row(row: dict) -> None:
+    print(
+        f"=============={row['duration_sec'] / 60:.1f} min audio, {row['chunks']} chunks, "
+        f"{row['segments']} segments, {row['turns']} turns (peak RSS {row['peak_rss_mb']:.0f} MB)=============="
+    )
+    for stage, stats in row["stages"].items():
+        memory = f"  peak alloc {stats['peak_alloc_mb']:9.1f} MB" if "peak_alloc_mb" in stats else ""
+        print(f"  {stage:<22} {stats['seconds'] * 1000:10.1f} ms{memory}")
+
+
+def main(args):
+    report = run_benchmark(args)
+    if report["scaling"]:
+        print("==============Scaling (seconds ~ size^k)==============")
+        for stage, k in report["scaling"].items():
+            print(f"  {stage:<22} k = {k:.2f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Saved benchmark report to {args.output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline CPU benchmark of the preprocessing and post-processing stages, using stub models and synthetic audio")
+    parser.add_argument("--durations", type=float, nargs="+", default=[60, 300, 1200, 3600], help="Synthetic audio lengths in seconds")
+    parser.add_argument("--segments_per_min", type=float, nargs="+", default=[20], help="Stub ASR segment densities; several values give a curve over segment count")
+    parser.add_argument("--num_speakers", type=int, default=3, help="Number of synthetic speakers")
+    parser.add_argument("--source_sr", type=int, default=22050, help="Sampling rate of the synthetic files (!= 16000 exercises resampling)")
+    parser.add_argument("--asr_batch_size", type=int, default=8, help="Passed through to _run_asr_on_segments")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage; the fastest is reported")
+    parser.add_argument("--no_trace_memory", dest="trace_memory", action="store_false", help="Skip the extra tracemalloc run per stage")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic audio")
+    parser.add_argument("--output", type=str, default=None, help="Write the full report (all rows and scaling exponents) to this JSON file")
+    args = parser.parse_args()
+    main(args)
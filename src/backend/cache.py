@@ -0,0 +1,326 @@
+from pyannote.core import Segment, Annotation
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+import numpy as np
+
+# Arguments that change what ends up in a transcript. A cached result is only reused
+# when all of them match the current run.
+RESULT_CONFIG_KEYS = [
+    "online_llm",
+    "online_llm_model",
+    "online_chunk_sec",
+    "online_chunk_overlap_sec",
+    "asr_model_name",
+    "openai_language",
+    "qwen_language",
+    "diarization_model_name",
+    "num_speakers",
+    "streaming_audio",
+]
+
+# Arguments each stage's artifacts depend on.
+ASR_CONFIG_KEYS = ["asr_model_name", "openai_language", "qwen_language"]
+DIARIZATION_CONFIG_KEYS = ["diarization_model_name", "num_speakers"]
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Content hash of a file, read in blocks so large recordings are never fully loaded.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def config_key(config: dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def result_config(args, sampling_rate: int = 16000) -> dict:
+    config = {key: getattr(args, key, None) for key in RESULT_CONFIG_KEYS}
+    config["sampling_rate"] = sampling_rate
+    # Only whether chunks are batched matters (as in asr_config), not the batch size itself
+    config["batched"] = getattr(args, "asr_batch_size", 1) > 1
+    return config
+
+
+def array_sha256(waveform: np.ndarray) -> str:
+    array = np.ascontiguousarray(waveform)
+    digest = hashlib.sha256(f"{array.dtype.str}{array.shape}".encode("ascii"))
+    digest.update(array.data)
+    return digest.hexdigest()
+
+
+def asr_config(args) -> dict:
+    config = {key: getattr(args, key, None) for key in ASR_CONFIG_KEYS}
+    # Batched decoding takes a different code path in some wrappers
+    config["batched"] = getattr(args, "asr_batch_size", 1) > 1
+    return config
+
+
+def diarization_config(args) -> dict:
+    return {key: getattr(args, key, None) for key in DIARIZATION_CONFIG_KEYS}
+
+
+def segments_to_rows(chunk_output: list) -> list:
+    return [[float(seg.start), float(seg.end), text] for seg, text in chunk_output]
+
+
+def rows_to_segments(rows: list) -> list:
+    return [(Segment(start, end), text) for start, end, text in rows]
+
+
+def annotation_to_rows(ann: Annotation) -> list:
+    return [
+        [float(seg.start), float(seg.end), track, label]
+        for seg, track, label in ann.itertracks(yield_label=True)
+    ]
+
+
+def rows_to_annotation(rows: list) -> Annotation:
+    ann = Annotation()
+    for start, end, track, label in rows:
+        ann[Segment(start, end), track] = label
+    return ann
+
+
+# Read once at import: os.umask can only be queried by setting it, which is not thread-safe
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def default_file_mode() -> int:
+    """
+    Permissions a plain open() would give a new file under the umask (usually 0644).
+    mkstemp creates its files 0600, which would leave published outputs unreadable to a web
+    server running as another user.
+    """
+    return 0o666 & ~_UMASK
+
+
+def atomic_write_text(path: str, text: str) -> None:
+    """
+    Writes `text` to a temporary file next to `path` and renames it into place,
+    so readers never see a partially written file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.chmod(tmp_path, default_file_mode())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ResultCache:
+    """
+    Persistent cache of final transcripts keyed on the audio content hash plus the
+    model/preprocessing configuration. Least recently used entries are evicted once
+    the cache exceeds max_entries or max_bytes.
+    """
+    def __init__(self, cache_dir: str, max_entries: int | None = None, max_bytes: int | None = None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(audio_hash: str, config: dict) -> str:
+        return config_key({"audio_sha256": audio_hash, "config": config})
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str) -> list | None:
+        """
+        return: list of (Segment, speaker, text) or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        # Bump the modification time so eviction sees this entry as recently used
+        os.utime(path, None)
+        return [(Segment(start, end), speaker, text) for start, end, speaker, text in entry["segments"]]
+
+    def put(self, key: str, merged: list, audio_hash: str, config: dict) -> None:
+        entry = {
+            "audio_sha256": audio_hash,
+            "config": config,
+            "created": time.time(),
+            "segments": [[float(seg.start), float(seg.end), speaker, text] for seg, speaker, text in merged],
+        }
+        atomic_write_text(self._path(key), json.dumps(entry, ensure_ascii=False))
+        self.evict()
+
+    def evict(self) -> None:
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for fname in files:
+                if fname.endswith(".json"):
+                    path = os.path.join(root, fname)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (
+            (self.max_entries is not None and len(entries) > self.max_entries)
+            or (self.max_bytes is not None and total_bytes > self.max_bytes)
+        ):
+            _, size, path = entries.pop(0)
+            os.remove(path)
+            total_bytes -= size
+
+
+class StageCache:
+    """
+    Per-stage intermediate artifacts in a single SQLite file: ASR output per chunk
+    (keyed by chunk hash + ASR config) and the diarization annotation (keyed by
+    audio hash + diarization config), stored as zlib-compressed JSON. Each stage is
+    recomputed only when its own inputs or configuration change.
+    """
+    ASR = "asr"
+    DIARIZATION = "diarization"
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # ASR and diarization may run in different threads (--concurrent_stages)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "stage TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (stage, key))"
+        )
+        self._conn.commit()
+
+    def _get(self, stage: str, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM artifacts WHERE stage = ? AND key = ?", (stage, key)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def _put(self, stage: str, key: str, value) -> None:
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO artifacts (stage, key, value, created) VALUES (?, ?, ?, ?)",
+                (stage, key, blob, time.time())
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def asr_key(chunk: np.ndarray, config: dict) -> str:
+        return config_key({"chunk_sha256": array_sha256(chunk), "config": config})
+
+    @staticmethod
+    def diarization_key(waveform: np.ndarray, sampling_rate: int, config: dict) -> str:
+        return config_key({
+            "audio_sha256": array_sha256(waveform),
+            "sampling_rate": sampling_rate,
+            "config": config,
+        })
+
+    def get_asr(self, key: str) -> list | None:
+        """
+        return: list of (Segment, text) relative to the chunk start, or None on a miss
+        """
+        value = self._get(self.ASR, key)
+        return None if value is None else rows_to_segments(value)
+
+    def put_asr(self, key: str, chunk_output: list) -> None:
+        self._put(self.ASR, key, segments_to_rows(chunk_output))
+
+    def get_diarization(self, key: str) -> Annotation | None:
+        value = self._get(self.DIARIZATION, key)
+        return None if value is None else rows_to_annotation(value)
+
+    def put_diarization(self, key: str, ann: Annotation) -> None:
+        self._put(self.DIARIZATION, key, annotation_to_rows(ann))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class UploadCache:
+    """
+    JSON index of audio uploaded to an online model's file store, keyed by content hash, so a
+    retry, a prompt change or a rerun reuses the remote copy while it has not expired.
+    Entries: {"name": remote file name, "expires": epoch seconds, "last_used": epoch seconds, ...}
+    """
+    def __init__(self, path: str, reuse_margin_sec: float = 3600.0):
+        self.path = path
+        # An entry this close to expiry is not reused: it could vanish mid-request
+        self.reuse_margin_sec = reuse_margin_sec
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _update(self, fn) -> dict:
+        # Re-read before every write so entries added by other processes are kept
+        with self._lock:
+            entries = self._load()
+            fn(entries)
+            atomic_write_text(self.path, json.dumps(entries, ensure_ascii=False, indent=2))
+            return entries
+
+    def get(self, audio_hash: str) -> dict | None:
+        """
+        return: the entry of a still-valid upload of this content, or None
+        """
+        with self._lock:
+            entry = self._load().get(audio_hash)
+        if entry is None or entry.get("expires", 0) - self.reuse_margin_sec <= time.time():
+            return None
+
+        def touch(entries):
+            if audio_hash in entries:
+                entries[audio_hash]["last_used"] = time.time()
+        self._update(touch)
+        return entry
+
+    def put(self, audio_hash: str, entry: dict) -> None:
+        now = time.time()
+        entry = dict(entry, uploaded=now, last_used=now)
+        self._update(lambda entries: entries.__setitem__(audio_hash, entry))
+
+    def remove(self, audio_hash: str) -> None:
+        self._update(lambda entries: entries.pop(audio_hash, None))
+
+    def entries(self) -> dict:
+        with self._lock:
+            return self._load()
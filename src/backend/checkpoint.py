@@ -0,0 +1,76 @@
+from cache import config_key, segments_to_rows, rows_to_segments, annotation_to_rows, rows_to_annotation
+import json
+import os
+import threading
+
+
+class ChunkJournal:
+    """
+    Append-only JSONL checkpoint of one file's progress: the chunk plan, each chunk's
+    ASR output (with its offset) as soon as it finishes, and the finished diarization.
+    A restarted run with the same audio and configuration reloads the journal and only
+    computes what is missing. The journal is deleted once the transcript is saved.
+    """
+    def __init__(self, checkpoint_dir: str, audio_hash: str, config: dict, boundaries: list):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        key = config_key({"audio_sha256": audio_hash, "config": config})
+        self.path = os.path.join(checkpoint_dir, f"{key}.jsonl")
+        self.boundaries = [list(boundary) for boundary in boundaries]
+        self.asr: dict[int, list] = {}
+        self.diarization = None
+        # ASR and diarization may finish in different threads (--concurrent_stages)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        records = []
+        if os.path.exists(self.path):
+            valid_bytes = 0
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        break
+                    valid_bytes += len(line)
+            # A crash can leave the last line half written; drop it before appending again
+            if valid_bytes < os.path.getsize(self.path):
+                with open(self.path, "r+b") as f:
+                    f.truncate(valid_bytes)
+
+        if not records or records[0].get("type") != "plan" or records[0].get("boundaries") != self.boundaries:
+            # New file, or the chunking changed: start over
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"type": "plan", "boundaries": self.boundaries}) + "\n")
+            return
+
+        for record in records[1:]:
+            if record.get("type") == "asr":
+                self.asr[record["chunk"]] = rows_to_segments(record["segments"])
+            elif record.get("type") == "diarization":
+                self.diarization = rows_to_annotation(record["turns"])
+
+    def _append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record_asr(self, chunk: int, offset: float, chunk_output: list) -> None:
+        self.asr[chunk] = chunk_output
+        self._append({
+            "type": "asr",
+            "chunk": chunk,
+            "offset": offset,
+            "segments": segments_to_rows(chunk_output),
+        })
+
+    def record_diarization(self, ann) -> None:
+        self.diarization = ann
+        self._append({"type": "diarization", "turns": annotation_to_rows(ann)})
+
+    def discard(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
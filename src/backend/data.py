@@ -1,20 +1,97 @@
 import os
+import queue
+import threading
+from typing import Callable, Iterable, Iterator
 import numpy as np
-from torch.utils.data import Dataset
 import soundfile as sf
-from librosa.core import resample as lr_resample
 
-class AudioInput(Dataset):
+from peaks import PeakPyramid, compute_peaks
+
+
+class _StreamingEnvelope:
+    """
+    Moving average of block-wise amplitudes, equal to
+    np.convolve(amplitude, ones(window_size) / window_size, mode="same")
+    over the whole signal, carrying window context between blocks.
+    """
+    def __init__(self, window_size: int):
+        self.window_size = max(1, window_size)
+        self.right = (self.window_size - 1) // 2
+        self.left = self.window_size - 1 - self.right
+        # The first `left` entries are the zero padding before the signal starts.
+        self.buffer = np.zeros(self.left, dtype=np.float64)
+
+    def _emit(self) -> np.ndarray:
+        count = len(self.buffer) - self.left - self.right
+        if count <= 0:
+            return np.zeros(0, dtype=np.float64)
+        cumsum = np.concatenate(([0.0], np.cumsum(self.buffer)))
+        envelope = (cumsum[self.window_size:self.window_size + count] - cumsum[:count]) / self.window_size
+        self.buffer = self.buffer[count:]
+        return envelope
+
+    def feed(self, amplitude: np.ndarray) -> np.ndarray:
+        self.buffer = np.concatenate((self.buffer, amplitude.astype(np.float64, copy=False)))
+        return self._emit()
+
+    def finish(self) -> np.ndarray:
+        self.buffer = np.concatenate((self.buffer, np.zeros(self.right, dtype=np.float64)))
+        return self._emit()
+
+
+class _StreamingIntervals:
+    """
+    Block-wise equivalent of AudioInput._mask_to_intervals: collects (start, end)
+    runs of True, carrying an open run over to the next block.
+    """
+    def __init__(self):
+        self.offset = 0
+        self.run_start: int | None = None
+        self.intervals: list[tuple[int, int]] = []
+
+    def feed(self, mask: np.ndarray) -> None:
+        prev = 1 if self.run_start is not None else 0
+        diff = np.diff(mask.astype(np.int8), prepend=np.int8(prev))
+        starts = (np.flatnonzero(diff == 1) + self.offset).tolist()
+        ends = (np.flatnonzero(diff == -1) + self.offset).tolist()
+        if self.run_start is not None and ends:
+            self.intervals.append((self.run_start, ends.pop(0)))
+            self.run_start = None
+        self.intervals.extend(zip(starts, ends))
+        if len(starts) > len(ends):
+            self.run_start = starts[-1]
+        self.offset += len(mask)
+
+    def finish(self) -> list[tuple[int, int]]:
+        if self.run_start is not None:
+            self.intervals.append((self.run_start, self.offset))
+            self.run_start = None
+        return self.intervals
+
+
+class AudioInput:
     def __init__(
         self,
         audio_dir: str,
         sampling_rate: int = 16000,
         target_files: list[str] | None = None,
-        processed_audio_dir: str = "outputs"
+        processed_audio_dir: str = "outputs",
+        skip_processed: bool = True,
+        num_speakers: int | None = None,
+        streaming: bool = False,
+        stream_block_sec: float = 60.0,
+        peaks_per_sec: float | None = None
     ):
         self.audio_dir = audio_dir
-        self._num_speakers = audio_dir.replace("/","").split("_")[-1]
+        if num_speakers is not None:
+            self._num_speakers = num_speakers
+        else:
+            self._num_speakers = audio_dir.replace("/","").split("_")[-1]
         self.sampling_rate = sampling_rate
+        self.streaming = streaming
+        self.stream_block_sec = stream_block_sec
+        # Waveform peak pyramids are summarized from the decoded audio when set
+        self.peaks_per_sec = peaks_per_sec
         self.skipped_files: list[str] = []
         available_audio_list = sorted([
             fname for fname in os.listdir(audio_dir)
@@ -32,7 +109,7 @@ class AudioInput(Dataset):
             self.audio_list = [fname for fname in available_audio_list if fname in requested_files]
         else:
             processed_audio_files = set()
-            if os.path.isdir(processed_audio_dir):
+            if skip_processed and os.path.isdir(processed_audio_dir):
                 processed_audio_files = {
                     fname for fname in os.listdir(processed_audio_dir)
                     if os.path.isfile(os.path.join(processed_audio_dir, fname))
@@ -48,6 +125,13 @@ class AudioInput(Dataset):
     def __len__(self) -> int:
         return len(self.audio_list)
 
+    def duration(self, idx: int) -> float:
+        """
+        Duration in seconds of the idx-th file, read from its header without decoding it.
+        """
+        info = sf.info(os.path.join(self.audio_dir, self.audio_list[idx]))
+        return info.frames / float(info.samplerate)
+
     @staticmethod
     def _audio_envelope(waveform: np.ndarray, window_size: int) -> np.ndarray:
         if waveform.ndim == 1:
@@ -113,33 +197,34 @@ class AudioInput(Dataset):
             return waveform
         return np.concatenate(chunks, axis=0)
 
-    def _split_by_silence_candidates(
-        self,
-        waveform: np.ndarray,
+    @staticmethod
+    def _plan_chunk_boundaries(
+        silences: list[tuple[int, int]],
+        total_samples: int,
         sr: int,
         min_chunk_sec: float = 20.0,
         max_chunk_sec: float = 30.0,
         min_split_silence_sec: float = 0.15
-    ) -> list[np.ndarray]:
-        total_samples = len(waveform)
+    ) -> list[tuple[int, int]]:
+        """
+        Plans (start, end) sample offsets of chunks between min_chunk_sec and max_chunk_sec long,
+        cutting at the midpoint of the last long-enough silence inside each window.
+        Each chunk costs two binary searches over the sorted silence midpoints.
+        """
         if total_samples == 0:
-            return [waveform]
+            return [(0, 0)]
 
         min_chunk = int(min_chunk_sec * sr)
         max_chunk = int(max_chunk_sec * sr)
         min_split_silence = int(min_split_silence_sec * sr)
 
-        silences = self._detect_silences(waveform, sr)
-        mids = []
-        for start, end in silences:
-            if (end - start) >= min_split_silence:
-                mid = (start + end) // 2
-                if 0 < mid < total_samples:
-                    mids.append(mid)
-        mids = sorted(set(mids))
+        intervals = np.asarray(silences, dtype=np.int64).reshape(-1, 2)
+        intervals = intervals[(intervals[:, 1] - intervals[:, 0]) >= min_split_silence]
+        mids = (intervals[:, 0] + intervals[:, 1]) // 2
+        mids = np.unique(mids[(mids > 0) & (mids < total_samples)])
 
-        if not mids:
-            return [waveform]
+        if mids.size == 0:
+            return [(0, total_samples)]
 
         boundaries: list[tuple[int, int]] = []
         start = 0
@@ -152,13 +237,13 @@ class AudioInput(Dataset):
 
             window_min = start + min_chunk
             window_max = start + max_chunk
-            in_window = [m for m in mids if window_min <= m < window_max]
+            # mids[:after_max] < window_max <= mids[after_max:]
+            after_max = int(np.searchsorted(mids, window_max, side="left"))
 
-            if in_window:
-                end = in_window[-1]
+            if after_max > 0 and mids[after_max - 1] >= window_min:
+                end = int(mids[after_max - 1])
             else:
-                after_max = [m for m in mids if m >= window_max]
-                end = after_max[0] if after_max else total_samples
+                end = int(mids[after_max]) if after_max < mids.size else total_samples
 
             if end <= start:
                 end = min(start + max_chunk, total_samples)
@@ -175,39 +260,377 @@ class AudioInput(Dataset):
                 boundaries[-2] = (prev_start, last_end)
                 boundaries.pop()
 
-        return [waveform[s:e] for s, e in boundaries if e > s]
+        return [(s, e) for s, e in boundaries if e > s]
 
-    def _preprocess_waveform(self, waveform: np.ndarray, sr: int) -> list[np.ndarray]:
+    def _chunk_boundaries(
+        self,
+        waveform: np.ndarray,
+        sr: int,
+        min_chunk_sec: float = 20.0,
+        max_chunk_sec: float = 30.0,
+        min_split_silence_sec: float = 0.15
+    ) -> list[tuple[int, int]]:
+        silences = self._detect_silences(waveform, sr) if len(waveform) > 0 else []
+        return self._plan_chunk_boundaries(
+            silences,
+            len(waveform),
+            sr,
+            min_chunk_sec=min_chunk_sec,
+            max_chunk_sec=max_chunk_sec,
+            min_split_silence_sec=min_split_silence_sec
+        )
+
+    def _split_by_silence_candidates(
+        self,
+        waveform: np.ndarray,
+        sr: int,
+        min_chunk_sec: float = 20.0,
+        max_chunk_sec: float = 30.0,
+        min_split_silence_sec: float = 0.15
+    ) -> list[np.ndarray]:
+        boundaries = self._chunk_boundaries(
+            waveform,
+            sr,
+            min_chunk_sec=min_chunk_sec,
+            max_chunk_sec=max_chunk_sec,
+            min_split_silence_sec=min_split_silence_sec
+        )
+        return [waveform[s:e] for s, e in boundaries]
+
+    def _plan_waveform(self, waveform: np.ndarray, sr: int) -> tuple[np.ndarray, list[tuple[int, int]]]:
+        """
+        Returns the silence-compressed waveform and the (start, end) sample offsets of its chunks.
+        """
         duration_sec = len(waveform) / float(sr)
         if duration_sec <= 30.0:
-            return [waveform]
+            return waveform, [(0, len(waveform))]
 
         compressed = self._shrink_long_silences(waveform, sr, max_silence_sec=2.0)
-        segments = self._split_by_silence_candidates(
+        boundaries = self._chunk_boundaries(
             compressed,
             sr,
             min_chunk_sec=20.0,
             max_chunk_sec=30.0,
             min_split_silence_sec=0.15
         )
-        return segments if segments else [compressed]
+        return compressed, boundaries if boundaries else [(0, len(compressed))]
+
+    def _preprocess_waveform(self, waveform: np.ndarray, sr: int) -> list[np.ndarray]:
+        compressed, boundaries = self._plan_waveform(waveform, sr)
+        return [compressed[s:e] for s, e in boundaries]
+
+    def split_for_upload(
+        self,
+        idx: int,
+        out_dir: str,
+        chunk_sec: float = 600.0,
+        overlap_sec: float = 30.0
+    ) -> list[tuple[str, float]]:
+        """
+        Writes the idx-th file as WAV pieces of up to chunk_sec, cut in silences on the original
+        timeline (long silences are kept, so offsets stay exact), for models that take whole files.
+        Every piece but the last also covers the first overlap_sec seconds of the next one.
+        return: list of (piece path, start offset in seconds); the original path if it is short enough
+        """
+        path = os.path.join(self.audio_dir, self.audio_list[idx])
+        if self.duration(idx) <= chunk_sec:
+            return [(path, 0.0)]
+
+        waveform, sr = sf.read(path, dtype="float32")
+        boundaries = self._plan_chunk_boundaries(
+            self._detect_silences(waveform, sr),
+            len(waveform),
+            sr,
+            min_chunk_sec=chunk_sec * 0.75,
+            max_chunk_sec=chunk_sec,
+            min_split_silence_sec=0.3
+        )
+        overlap = int(overlap_sec * sr)
+        stem = os.path.splitext(self.audio_list[idx])[0]
+        pieces = []
+        for k, (start, end) in enumerate(boundaries):
+            if k + 1 < len(boundaries):
+                end = min(len(waveform), end + overlap)
+            piece_path = os.path.join(out_dir, f"{stem}_part{k:03d}.wav")
+            sf.write(piece_path, waveform[start:end], sr, subtype="PCM_16")
+            pieces.append((piece_path, start / float(sr)))
+        return pieces
+
+    def _iter_blocks(self, path: str) -> Iterator[np.ndarray]:
+        """
+        Reads `path` block by block as float32 at self.sampling_rate, resampling with a
+        streaming soxr resampler, so the whole signal is never held in memory.
+        Yields (time,) blocks for mono files and (time, channels) blocks otherwise.
+        """
+        import soxr
+
+        with sf.SoundFile(path) as audio_file:
+            channels = audio_file.channels
+            blocksize = max(1, int(self.stream_block_sec * audio_file.samplerate))
+            resampler = None
+            if audio_file.samplerate != self.sampling_rate:
+                resampler = soxr.ResampleStream(
+                    audio_file.samplerate, self.sampling_rate, channels, dtype="float32"
+                )
+            for block in audio_file.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+                if resampler is not None:
+                    block = resampler.resample_chunk(block)
+                if len(block):
+                    yield block[:, 0] if channels == 1 else block
+            if resampler is not None:
+                tail = resampler.resample_chunk(np.zeros((0, channels), dtype=np.float32), last=True)
+                if len(tail):
+                    yield tail[:, 0] if channels == 1 else tail
+
+    def _iter_envelope(self, path: str) -> Iterator[np.ndarray]:
+        window_size = max(1, int(self.sampling_rate * 0.02))
+        envelope = _StreamingEnvelope(window_size)
+        for block in self._iter_blocks(path):
+            amplitude = np.abs(block) if block.ndim == 1 else np.max(np.abs(block), axis=1)
+            yield envelope.feed(amplitude)
+        yield envelope.finish()
+
+    def _stream_plan(
+        self,
+        path: str,
+        threshold_ratio: float = 0.02,
+        min_threshold: float = 1e-4,
+        max_silence_sec: float = 2.0
+    ) -> dict:
+        """
+        Streaming counterpart of _plan_waveform. Two block-wise passes over the file find the
+        envelope peak and then the silent intervals; from those it derives which sample ranges
+        survive _shrink_long_silences ("keep_ranges", original timeline) and the chunk
+        boundaries on the compressed timeline ("boundaries").
+        """
+        sr = self.sampling_rate
+        total_samples = 0
+        max_amp = 0.0
+        for envelope in self._iter_envelope(path):
+            total_samples += len(envelope)
+            if envelope.size:
+                max_amp = max(max_amp, float(np.max(envelope)))
+
+        if total_samples / float(sr) <= 30.0:
+            return {
+                "keep_ranges": [(0, total_samples)],
+                "boundaries": [(0, total_samples)],
+                "total_samples": total_samples,
+            }
+
+        threshold = max(min_threshold, max_amp * threshold_ratio)
+        tracker = _StreamingIntervals()
+        for envelope in self._iter_envelope(path):
+            tracker.feed(envelope <= threshold)
+        silences = tracker.finish()
+
+        # Mirror _shrink_long_silences, and carry each silence over to the compressed timeline
+        max_silence_samples = int(max_silence_sec * sr)
+        keep_ranges: list[tuple[int, int]] = []
+        compressed_silences: list[tuple[int, int]] = []
+        removed = 0
+        cursor = 0
+        for start, end in silences:
+            if start > cursor:
+                keep_ranges.append((cursor, start))
+            keep = min(end - start, max_silence_samples)
+            keep_ranges.append((start, start + keep))
+            compressed_silences.append((start - removed, start - removed + keep))
+            removed += (end - start) - keep
+            cursor = end
+        if cursor < total_samples:
+            keep_ranges.append((cursor, total_samples))
+
+        merged_ranges: list[tuple[int, int]] = []
+        for start, end in keep_ranges:
+            if merged_ranges and merged_ranges[-1][1] == start:
+                merged_ranges[-1] = (merged_ranges[-1][0], end)
+            elif end > start:
+                merged_ranges.append((start, end))
+
+        compressed_total = total_samples - removed
+        boundaries = self._plan_chunk_boundaries(
+            compressed_silences,
+            compressed_total,
+            sr,
+            min_chunk_sec=20.0,
+            max_chunk_sec=30.0,
+            min_split_silence_sec=0.15
+        )
+        return {
+            "keep_ranges": merged_ranges,
+            "boundaries": boundaries if boundaries else [(0, compressed_total)],
+            "total_samples": total_samples,
+        }
+
+    def _iter_planned_chunks(self, path: str, plan: dict, peaks: PeakPyramid | None = None) -> Iterator[np.ndarray]:
+        """
+        Third streaming pass: keeps only plan["keep_ranges"] of the signal and yields one
+        float32 array per entry of plan["boundaries"], as soon as that chunk is complete.
+        peaks: fed every block of the full (uncompressed) signal on the way
+        """
+        keep_ranges = plan["keep_ranges"]
+        boundaries = plan["boundaries"]
+        range_idx = 0
+        chunk_idx = 0
+        position = 0
+        compressed_position = 0
+        pieces: list[np.ndarray] = []
+
+        for block in self._iter_blocks(path):
+            if peaks is not None:
+                peaks.feed(block)
+            block_start, block_end = position, position + len(block)
+            position = block_end
+            while range_idx < len(keep_ranges) and keep_ranges[range_idx][0] < block_end:
+                keep_start, keep_end = keep_ranges[range_idx]
+                piece = block[max(keep_start, block_start) - block_start:min(keep_end, block_end) - block_start]
+                while len(piece) and chunk_idx < len(boundaries):
+                    take = boundaries[chunk_idx][1] - compressed_position
+                    pieces.append(piece[:take])
+                    compressed_position += len(piece[:take])
+                    piece = piece[take:]
+                    if compressed_position == boundaries[chunk_idx][1]:
+                        yield np.concatenate(pieces, axis=0)
+                        pieces = []
+                        chunk_idx += 1
+                if keep_end > block_end:
+                    break
+                range_idx += 1
+        if pieces:
+            yield np.concatenate(pieces, axis=0)
+
+    def stream_chunks(self, idx: int, peaks: PeakPyramid | None = None) -> tuple[dict, Iterator[np.ndarray]]:
+        """
+        Streaming preprocessing of one file: returns the chunk plan and a generator that
+        decodes the chunks lazily, so peak memory is bounded by the block and chunk sizes.
+        peaks: summarizes the waveform once the generator is exhausted
+        """
+        path = os.path.join(self.audio_dir, self.audio_list[idx])
+        plan = self._stream_plan(path)
+        return plan, self._iter_planned_chunks(path, plan, peaks)
 
     def __getitem__(self, idx: int) -> dict:
         fname = self.audio_list[idx]
-        path = os.path.join(self.audio_dir, fname)
-        waveform, sr = sf.read(path)
-        if sr != self.sampling_rate:
-            waveform = lr_resample(
-                waveform,
-                orig_sr=sr,
-                target_sr=self.sampling_rate,
-                axis=0
-            )
-            sr = self.sampling_rate
-        waveform_segments = self._preprocess_waveform(waveform, sr)
+        peaks = None
+        if self.streaming:
+            pyramid = PeakPyramid(self.sampling_rate, self.peaks_per_sec) if self.peaks_per_sec else None
+            plan, chunks = self.stream_chunks(idx, pyramid)
+            waveform_segments = list(chunks)
+            boundaries = plan["boundaries"]
+            if pyramid is not None:
+                peaks = pyramid.finish()
+        else:
+            path = os.path.join(self.audio_dir, fname)
+            waveform, sr = sf.read(path)
+            if sr != self.sampling_rate:
+                from librosa.core import resample as lr_resample
+
+                waveform = lr_resample(
+                    waveform,
+                    orig_sr=sr,
+                    target_sr=self.sampling_rate,
+                    axis=0
+                )
+                sr = self.sampling_rate
+            if self.peaks_per_sec:
+                # From the full waveform: the frontend plays the original, not the silence-compressed audio
+                peaks = compute_peaks(waveform, sr, self.peaks_per_sec)
+            compressed, boundaries = self._plan_waveform(waveform, sr)
+            waveform_segments = [compressed[s:e] for s, e in boundaries]
         return {
+            "index":       idx,
             "basename":    fname,
             "waveform":    waveform_segments,
+            "boundaries":  boundaries,
             "sample_count": sum(len(seg) for seg in waveform_segments),
-            "segment_sample_counts": [len(seg) for seg in waveform_segments]
+            "segment_sample_counts": [len(seg) for seg in waveform_segments],
+            "peaks":       peaks
         }
+
+
+def _identity_collate(item: dict) -> dict:
+    return item
+
+
+def _prefetch_with_thread(dataset: AudioInput, indices: Iterable[int], depth: int) -> Iterator[dict]:
+    """
+    Bounded producer/consumer queue: a background thread preprocesses up to
+    `depth` files ahead of the consumer.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def _put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce() -> None:
+        try:
+            for idx in indices:
+                if not _put(("item", dataset[idx])):
+                    return
+        except BaseException as exc:
+            _put(("error", exc))
+            return
+        _put(("done", None))
+
+    producer = threading.Thread(target=_produce, name="audio-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, payload = buffer.get()
+            if kind == "error":
+                raise payload
+            if kind == "done":
+                return
+            yield payload
+    finally:
+        stop.set()
+        producer.join()
+
+
+def iterate_audio(
+    dataset: AudioInput,
+    prefetch_depth: int = 0,
+    num_workers: int = 0,
+    claim: Callable[[str], bool] | None = None
+) -> Iterator[dict]:
+    """
+    Iterates over preprocessed items of `dataset` in order.
+    prefetch_depth: number of files preprocessed ahead of the consumer (0 = no prefetch)
+    num_workers: if > 0, preprocess in DataLoader worker processes instead of a thread
+    claim: if given, only files for which claim(basename) returns True are loaded. It is
+        called when a file is picked for preprocessing, which with prefetching is ahead of the
+        consumer: up to prefetch_depth + 1 files in the prefetch thread, or num_workers *
+        prefetch_depth when the DataLoader draws indices in this process. Claims can therefore
+        be held for files not processed yet; closing the iterator stops further claims, and
+        the caller releases whatever was claimed.
+    """
+    indices = (
+        idx for idx in range(len(dataset))
+        if claim is None or claim(dataset.audio_list[idx])
+    )
+    if num_workers > 0:
+        # AudioInput is a plain map-style dataset; torch is only needed for worker processes
+        from torch.utils.data import DataLoader
+
+        loader = DataLoader(
+            dataset,
+            batch_size=None,
+            sampler=indices,
+            num_workers=num_workers,
+            prefetch_factor=max(1, prefetch_depth),
+            collate_fn=_identity_collate,
+        )
+        yield from loader
+    elif prefetch_depth > 0:
+        yield from _prefetch_with_thread(dataset, indices, prefetch_depth)
+    else:
+        for idx in indices:
+            yield dataset[idx]
@@ -0,0 +1,157 @@
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from cache import atomic_write_text
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single writer assumed
+    fcntl = None
+
+# Lists of processed audio files: read by the frontend, and a backup next to the outputs
+INDEX_PATHS = ["src/frontend/public/audios/index.json", "outputs/index.json"]
+
+
+@contextmanager
+def _locked(path: str):
+    # Lock a sidecar file: the index itself is replaced by rename, so its inode changes on every write
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def rebuild_entries(outputs_dir: str = "outputs") -> list[str]:
+    """
+    Recovers the index from the output directories: every outputs/<name>/<name>.json is one
+    processed file, listed under the name of the audio saved next to it.
+    return: audio file names, oldest transcript first
+    """
+    found = []
+    if not os.path.isdir(outputs_dir):
+        return []
+    for name in os.listdir(outputs_dir):
+        transcript = os.path.join(outputs_dir, name, f"{name}.json")
+        if not os.path.isfile(transcript):
+            continue
+        audio = f"{name}.wav"
+        for file_name in sorted(os.listdir(os.path.join(outputs_dir, name))):
+            # The source WAV, not a playback rendition (.flac/.opus) saved alongside it
+            stem, ext = os.path.splitext(file_name)
+            if stem == name and ext.lower() == ".wav":
+                audio = file_name
+                break
+        found.append((os.path.getmtime(transcript), audio))
+    return [audio for _, audio in sorted(found)]
+
+
+class IndexManager:
+    """
+    Keeps the index.json files up to date without rewriting them for every file.
+    Entries are collected in memory and flushed together, at most flush_interval seconds after
+    the first unflushed one (or once flush_every are pending, or on flush()/exit). A flush
+    merges them into what is on disk under an exclusive lock, so several processes can share
+    the index, and replaces the file atomically. Unreadable index files are rebuilt from the
+    output directories instead of being reset.
+    """
+    def __init__(
+        self,
+        paths: list[str] | None = None,
+        outputs_dir: str = "outputs",
+        flush_interval: float = 2.0,
+        flush_every: int = 100
+    ) -> None:
+        self.paths = paths or INDEX_PATHS
+        self.outputs_dir = outputs_dir
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self._lock = threading.RLock()
+        self._known = set()
+        self._pending = []
+        self._timer = None
+
+    def add(self, file_names) -> None:
+        names = file_names if isinstance(file_names, list) else [file_names]
+        with self._lock:
+            for name in names:
+                if name not in self._known:
+                    self._known.add(name)
+                    self._pending.append(name)
+            if len(self._pending) >= self.flush_every or self.flush_interval <= 0:
+                self.flush()
+            elif self._pending and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _read(self, path: str) -> list:
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                return data
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            pass
+        print(f"Warning: {path} is unreadable; rebuilding it from {self.outputs_dir}")
+        return rebuild_entries(self.outputs_dir)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            # Kept pending until every file is written, so a failed flush is retried by the next one
+            for path in self.paths:
+                with _locked(path):
+                    data = self._read(path)
+                    on_disk = set(data)
+                    data += [name for name in self._pending if name not in on_disk]
+                    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=2) + "\n")
+                    self._known.update(data)
+            self._pending = []
+
+    def rebuild(self) -> list[str]:
+        """
+        Rewrites every index file from the output directories, e.g. after outputs were deleted
+        or copied in by hand.
+        return: the rebuilt entries
+        """
+        with self._lock:
+            self.flush()
+            entries = rebuild_entries(self.outputs_dir)
+            for path in self.paths:
+                with _locked(path):
+                    atomic_write_text(path, json.dumps(entries, ensure_ascii=False, indent=2) + "\n")
+            self._known = set(entries)
+            return entries
+
+
+# Process-wide index shared by the pipeline; pending entries are written out at exit
+INDEX = IndexManager()
+atexit.register(INDEX.flush)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain the index.json files listing processed audio")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index files from the output directories")
+    parser.add_argument("--outputs_dir", type=str, default="outputs", help="Directory holding one sub-directory of outputs per file")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.error("nothing to do (use --rebuild)")
+    start = time.perf_counter()
+    entries = IndexManager(outputs_dir=args.outputs_dir).rebuild()
+    print(f"Rebuilt index with {len(entries)} entries in {time.perf_counter() - start:.2f}s")
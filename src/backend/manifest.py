@@ -0,0 +1,118 @@
+import argparse
+import csv
+import json
+import os
+from typing import Callable
+
+
+# Columns a manifest entry may set besides "path", "num_speakers" and "language"
+OVERRIDE_KEYS = [
+    "asr_model_name",
+    "diarization_model_name",
+    "openai_language",
+    "qwen_language",
+    "online_llm",
+    "online_llm_model",
+    "asr_device",
+    "diarization_device",
+]
+# Arguments that decide which model objects are loaded; entries sharing them share models
+MODEL_KEYS = [
+    "online_llm",
+    "online_llm_model",
+    "asr_model_name",
+    "asr_device",
+    "diarization_model_name",
+    "diarization_device",
+]
+
+
+def load_manifest(path: str) -> list[dict]:
+    """
+    Reads a manifest of audio files/directories to transcribe.
+    path: .jsonl (one JSON object per line) or .csv (with a header row); each entry needs "path"
+    and may set "num_speakers", "language" and any of OVERRIDE_KEYS
+    return: list of entries with empty CSV cells dropped
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+    entries = []
+    for line_no, row in enumerate(rows, start=1):
+        entry = {
+            key.strip(): value.strip() if isinstance(value, str) else value
+            for key, value in row.items()
+            if key is not None and value not in (None, "")
+        }
+        unknown = set(entry) - {"path", "num_speakers", "language", *OVERRIDE_KEYS}
+        if "path" not in entry or unknown:
+            raise ValueError(
+                f"{path} entry {line_no}: "
+                + ("missing 'path'" if "path" not in entry else f"unknown column(s): {', '.join(sorted(unknown))}")
+            )
+        entries.append(entry)
+    return entries
+
+
+def entry_args(args: argparse.Namespace, entry: dict, parse_overrides: Callable) -> argparse.Namespace:
+    """
+    Applies one manifest entry on top of the command-line arguments.
+    parse_overrides: parses a list of CLI tokens into a given namespace (validates types and choices)
+    return: new namespace with audio_dir/audio_files pointing at the entry
+    """
+    argv = []
+    for key in OVERRIDE_KEYS:
+        value = entry.get(key)
+        if key == "online_llm":
+            if value is not None and str(value).lower() in ("1", "true", "yes"):
+                argv.append("--online_llm")
+        elif value is not None:
+            argv += [f"--{key}", str(value)]
+    if "num_speakers" in entry:
+        argv += ["--num_speakers", str(entry["num_speakers"])]
+
+    job = parse_overrides(argv, argparse.Namespace(**vars(args)))
+    if "language" in entry:
+        # "language" targets whichever ASR model the entry ends up using
+        if job.asr_model_name == "qwen":
+            job = parse_overrides(["--qwen_language", str(entry["language"])], job)
+        else:
+            job.openai_language = str(entry["language"])
+
+    path = entry["path"]
+    if os.path.isdir(path):
+        job.audio_dir, job.audio_files = path, None
+    elif os.path.isfile(path):
+        job.audio_dir, job.audio_files = os.path.dirname(path) or ".", [os.path.basename(path)]
+    else:
+        raise FileNotFoundError(f"Manifest path not found: {path}")
+    return job
+
+
+def model_key(args: argparse.Namespace) -> tuple:
+    return tuple(getattr(args, key, None) for key in MODEL_KEYS)
+
+
+def group_jobs(jobs: list[argparse.Namespace]) -> list[list[argparse.Namespace]]:
+    """
+    Groups per-entry namespaces into transcribe() runs.
+    Runs are ordered so each model configuration is handled in one contiguous stretch, and entries
+    pointing into the same directory with identical settings are merged into a single run.
+    return: list of model groups, each a list of run namespaces
+    """
+    groups = {}
+    for job in jobs:
+        runs = groups.setdefault(model_key(job), {})
+        settings = {k: v for k, v in vars(job).items() if k != "audio_files"}
+        run_key = json.dumps(settings, sort_keys=True, default=str)
+        run = runs.get(run_key)
+        if run is None:
+            runs[run_key] = job
+        elif run.audio_files is None or job.audio_files is None:
+            run.audio_files = None
+        else:
+            run.audio_files = run.audio_files + [f for f in job.audio_files if f not in run.audio_files]
+    return [list(runs.values()) for runs in groups.values()]
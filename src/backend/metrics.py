@@ -0,0 +1,239 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from cache import atomic_write_text
+
+
+def log(args, message, level: int = 1) -> None:
+    """
+    Prints message if args.verbosity >= level.
+    level: 1 = progress banners, 2 = full model outputs (segment lists, annotations)
+    """
+    if getattr(args, "verbosity", 1) >= level:
+        print(message)
+
+
+def audio_seconds(audio, sampling_rate: int = 16000):
+    """
+    Length in seconds of a model input: (waveform, sr) tuples carry their rate, bare arrays are
+    assumed to be at sampling_rate, and file paths are unknown (None).
+    """
+    if isinstance(audio, tuple):
+        return len(audio[0]) / float(audio[1])
+    if hasattr(audio, "__len__") and not isinstance(audio, str):
+        return len(audio) / float(sampling_rate)
+    return None
+
+
+class MetricsRecorder:
+    """
+    Collects per-file timings (stages, model load/inference, queue wait, memory) of the file
+    currently being transcribed and cumulative totals for the process. With a metrics_dir,
+    every finished file is written to metrics_dir/files/<name>.json and the totals to a
+    Prometheus textfile (metrics_dir/transcriber_<worker>.prom, for node_exporter's textfile
+    collector). Without one, records are kept in memory only.
+    """
+    def __init__(self) -> None:
+        self.metrics_dir = None
+        self.worker = "main"
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = None
+        self._totals = {
+            "files": {},
+            "audio_seconds": 0.0,
+            "wall_seconds": 0.0,
+            "stages": {},
+            "model_load": {},
+            "model_inference": {},
+            "last_rtf": None,
+        }
+
+    def configure(self, metrics_dir: str | None, worker: str = "main") -> None:
+        self.metrics_dir = metrics_dir
+        self.worker = worker
+        if metrics_dir:
+            os.makedirs(os.path.join(metrics_dir, "files"), exist_ok=True)
+
+    def begin_file(self, basename: str, **fields) -> None:
+        if "torch" in sys.modules:
+            import torch
+
+            if torch.cuda.is_available():
+                torch.cuda.reset_peak_memory_stats()
+        with self._lock:
+            self._file = {
+                "file": basename,
+                "worker": self.worker,
+                "started": time.time(),
+                "stages": {},
+                "models": {},
+                **fields,
+            }
+            self._file_start = time.perf_counter()
+
+    def update_file(self, **fields) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.update(fields)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            totals = self._totals["stages"]
+            totals[name] = totals.get(name, 0.0) + seconds
+            if self._file is not None:
+                stages = self._file["stages"]
+                stages[name] = stages.get(name, 0.0) + seconds
+
+    def record_load(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._totals["model_load"][model] = seconds
+            if self._file is not None:
+                self._file["models"].setdefault(model, {})["load_seconds"] = seconds
+
+    @contextmanager
+    def model_call(self, model: str, audio_sec=None):
+        """
+        Times one inference call of `model`. Nested calls on the same thread (run() inside a
+        model's run_batch) are only counted once, by the outermost call.
+        """
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                self._add_inference(model, time.perf_counter() - start, audio_sec)
+
+    def _add_inference(self, model: str, seconds: float, audio_sec) -> None:
+        with self._lock:
+            total = self._totals["model_inference"].setdefault(model, {"seconds": 0.0, "calls": 0, "audio_seconds": 0.0})
+            total["seconds"] += seconds
+            total["calls"] += 1
+            total["audio_seconds"] += audio_sec or 0.0
+            if self._file is not None:
+                entry = self._file["models"].setdefault(model, {})
+                entry["inference_seconds"] = entry.get("inference_seconds", 0.0) + seconds
+                entry["calls"] = entry.get("calls", 0) + 1
+                if audio_sec is not None:
+                    entry["audio_seconds"] = entry.get("audio_seconds", 0.0) + audio_sec
+
+    @staticmethod
+    def _peak_memory() -> dict:
+        # ru_maxrss is in KiB on Linux; it is the process-wide high-water mark
+        memory = {"peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+        if "torch" in sys.modules:
+            import torch
+
+            if torch.cuda.is_available():
+                memory["peak_gpu_bytes"] = torch.cuda.max_memory_allocated()
+        return memory
+
+    def end_file(self, status: str = "done") -> dict | None:
+        """
+        Closes the current file's record, adds it to the totals and writes it out.
+        return: the finished record, or None if no file was open
+        """
+        with self._lock:
+            record = self._file
+            if record is None:
+                return None
+            self._file = None
+            record["wall_seconds"] = time.perf_counter() - self._file_start
+        return self._finish(record, status)
+
+    def record_file(self, basename: str, status: str, wall_seconds: float | None, **fields) -> dict:
+        """
+        Records a file handled outside begin_file/end_file, e.g. one of several requests in flight
+        at once, whose per-stage timings cannot be attributed to it.
+        """
+        record = {
+            "file": basename,
+            "worker": self.worker,
+            "started": time.time() - (wall_seconds or 0.0),
+            "stages": {},
+            "models": {},
+            "wall_seconds": wall_seconds or 0.0,
+            **fields,
+        }
+        return self._finish(record, status)
+
+    def _finish(self, record: dict, status: str) -> dict:
+        with self._lock:
+            record["status"] = status
+            record.update(self._peak_memory())
+            if record.get("audio_seconds"):
+                record["real_time_factor"] = record["wall_seconds"] / record["audio_seconds"]
+                self._totals["last_rtf"] = record["real_time_factor"]
+            files = self._totals["files"]
+            files[status] = files.get(status, 0) + 1
+            self._totals["audio_seconds"] += record.get("audio_seconds") or 0.0
+            self._totals["wall_seconds"] += record["wall_seconds"]
+
+        if self.metrics_dir:
+            name = os.path.splitext(record["file"])[0]
+            atomic_write_text(
+                os.path.join(self.metrics_dir, "files", f"{name}.json"),
+                json.dumps(record, ensure_ascii=False, indent=2)
+            )
+            self.write_prometheus()
+        return record
+
+    def write_prometheus(self) -> None:
+        if not self.metrics_dir:
+            return
+        with self._lock:
+            totals = json.loads(json.dumps(self._totals))
+        worker = f'worker="{self.worker}"'
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join([worker] + [f'{k}="{v}"' for k, v in labels.items()])
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        metric("transcriber_files_total", "counter", "Files finished, by status.",
+               [({"status": status}, count) for status, count in totals["files"].items()])
+        metric("transcriber_audio_seconds_total", "counter", "Seconds of audio transcribed.",
+               [({}, totals["audio_seconds"])])
+        metric("transcriber_file_wall_seconds_total", "counter", "Wall time spent on files.",
+               [({}, totals["wall_seconds"])])
+        metric("transcriber_stage_seconds_total", "counter", "Wall time per pipeline stage.",
+               [({"stage": stage}, seconds) for stage, seconds in totals["stages"].items()])
+        metric("transcriber_model_load_seconds", "gauge", "Time the last load of each model took.",
+               [({"model": model}, seconds) for model, seconds in totals["model_load"].items()])
+        metric("transcriber_model_inference_seconds_total", "counter", "Time spent in model inference.",
+               [({"model": model}, entry["seconds"]) for model, entry in totals["model_inference"].items()])
+        metric("transcriber_model_calls_total", "counter", "Model inference calls.",
+               [({"model": model}, entry["calls"]) for model, entry in totals["model_inference"].items()])
+        if totals["last_rtf"] is not None:
+            metric("transcriber_last_real_time_factor", "gauge", "Wall seconds per audio second of the last file.",
+                   [({}, totals["last_rtf"])])
+        for key, value in self._peak_memory().items():
+            metric(f"transcriber_{key}", "gauge", "Process peak memory.", [({}, value)])
+
+        atomic_write_text(
+            os.path.join(self.metrics_dir, f"transcriber_{self.worker}.prom"),
+            "\n".join(lines) + "\n"
+        )
+
+
+# Process-wide recorder shared by the models and the pipeline
+RECORDER = MetricsRecorder()
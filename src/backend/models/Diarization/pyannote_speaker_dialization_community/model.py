@@ -2,10 +2,11 @@ from pyannote.audio import Pipeline
 from pyannote.audio.core.task import Specifications
 from pyannote.core import Annotation, Segment
 import torch
+import numpy as np
 import soundfile as sf
 from models.base import BaseModel
 import time
-from typing import List, Tuple
+from typing import Any, List, Tuple
 import os
 
 
@@ -33,28 +34,54 @@ class SpeechDiarization(BaseModel):
             cache_dir=os.environ.get("HF_HOME", "./models")
         )
 
-    def inference(self, audio_source: str) -> Annotation:
+    @staticmethod
+    def _to_waveform_tensor(waveform: Any) -> torch.Tensor:
         """
-        Run diarization on a single audio file path and return an Annotation.
+        Convert a (time,) or (time, channels) array, or a (channels, time) tensor,
+        into the (channels, time) float32 tensor pyannote expects.
+        float32 numpy input is wrapped with torch.from_numpy without copying.
+        """
+        if isinstance(waveform, torch.Tensor):
+            tensor = waveform.to(torch.float32)
+            return tensor.unsqueeze(0) if tensor.ndim == 1 else tensor
+
+        waveform = np.asarray(waveform)
+        if waveform.dtype != np.float32:
+            waveform = waveform.astype(np.float32)
+        if waveform.ndim == 1:
+            return torch.from_numpy(waveform).unsqueeze(0)
+        return torch.from_numpy(waveform.T)
+
+    def inference(self, audio_source: Any) -> Annotation:
+        """
+        Run diarization and return an Annotation.
 
-        audio_source: Path to the audio file.
+        audio_source: Path to the audio file, or a (waveform, sample_rate) tuple where
+        waveform is a numpy array shaped (time,) / (time, channels) or a
+        (channels, time) torch tensor.
         """
-        print("==============Start Diarization==============")
+        self.log("==============Start Diarization==============")
         start_time = time.time()
 
-        waveform, sample_rate = sf.read(audio_source, always_2d=True, dtype="float32")
-        # pyannote expects (channels, time)
-        waveform = torch.from_numpy(waveform.T)
+        if isinstance(audio_source, tuple):
+            waveform, sample_rate = audio_source
+            waveform = self._to_waveform_tensor(waveform)
+            uri = "in-memory"
+        else:
+            waveform, sample_rate = sf.read(audio_source, always_2d=True, dtype="float32")
+            # pyannote expects (channels, time)
+            waveform = torch.from_numpy(waveform.T)
+            uri = audio_source
 
         ann: Annotation = self.model(
-            {"uri": audio_source, "waveform": waveform, "sample_rate": sample_rate},
+            {"uri": uri, "waveform": waveform, "sample_rate": sample_rate},
             num_speakers=self.args.num_speakers
         )
         return ann, start_time
 
     def parse_output(self, ann: Annotation, start_time: float) -> List[Tuple[Segment, str]]:
-        print(ann)
-        print(f"==============Diarization done in {time.time() - start_time:.2f} seconds.==============")
+        self.log(ann, level=2)
+        self.log(f"==============Diarization done in {time.time() - start_time:.2f} seconds.==============")
 
         if hasattr(ann, "speaker_diarization"):
             return ann.speaker_diarization
@@ -1,14 +1,25 @@
 from __future__ import annotations
 
 import os
-import re
+import threading
 import time
 import importlib
-from typing import Any, List, Tuple
+from typing import Any, Callable, List, Tuple
 
 from pyannote.core import Segment
 
+from cache import UploadCache, file_sha256
+from metrics import RECORDER, audio_seconds
 from models.OnlineLLM.Gemini.prompt import prompt
+from models.OnlineLLM.Gemini.transcript_parser import (
+	SegmentBuilder,
+	TranscriptStream,
+	TurnMerger,
+	seconds_to_timestamp,
+	timestamp_to_seconds,
+)
+from models.OnlineLLM.concurrency import TokenBucket, call_with_retry, run_concurrently
+from models.OnlineLLM.stitching import stitch_chunks
 from models.base import BaseModel
 
 
@@ -18,12 +29,24 @@ class OnlineLLMTranscription(BaseModel):
 		if not api_key:
 			raise EnvironmentError("GEMINI_API_KEY is not set.")
 
+		# Requests per second shared by every upload/generate call of this instance
+		self.rate_limiter = TokenBucket(getattr(self.args, "online_llm_rps", 0.0))
+		# Requests in flight across every caller (run_many's files and run_chunks' pieces alike)
+		self.request_slots = threading.BoundedSemaphore(max(1, getattr(self.args, "online_llm_concurrency", 1)))
+		upload_cache_path = getattr(self.args, "online_upload_cache", None)
+		self.upload_cache = UploadCache(upload_cache_path) if upload_cache_path else None
+
 		try:
 			from google import genai as genai_sdk
 
+			# GEMINI_BASE_URL points the client at a proxy or a local stand-in server
+			base_url = os.environ.get("GEMINI_BASE_URL")
 			return {
 				"provider": "google_genai",
-				"client": genai_sdk.Client(api_key=api_key),
+				"client": genai_sdk.Client(
+					api_key=api_key,
+					http_options={"base_url": base_url} if base_url else None,
+				),
 			}
 		except ImportError:
 			pass
@@ -42,173 +65,258 @@ class OnlineLLMTranscription(BaseModel):
 				"`google-generativeai`."
 			) from exc
 
-	@staticmethod
-	def _timestamp_to_seconds(ts_str: str) -> int | None:
-		try:
-			ts_str = ts_str.split(".")[0]
-			parts = list(map(int, ts_str.split(":")))
-			if len(parts) == 3:
-				h, m, s = parts
-				return h * 3600 + m * 60 + s
-			if len(parts) == 2:
-				m, s = parts
-				return m * 60 + s
-			return None
-		except (ValueError, AttributeError, IndexError):
-			return None
-
-	@staticmethod
-	def _seconds_to_timestamp(total_seconds: int | None) -> str:
-		if total_seconds is None or total_seconds < 0:
-			total_seconds = 0
-		hours, remainder = divmod(total_seconds, 3600)
-		minutes, seconds = divmod(remainder, 60)
-		return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
+	_timestamp_to_seconds = staticmethod(timestamp_to_seconds)
+	_seconds_to_timestamp = staticmethod(seconds_to_timestamp)
 
 	@classmethod
 	def _process_transcript(cls, input_text: str, max_segment_duration: int = 30) -> str:
-		lines = input_text.strip().splitlines()
+		merger = TurnMerger(max_segment_duration)
 		output_lines = []
-
-		current_segment_start_ts_str = None
-		current_segment_start_seconds = None
-		current_speaker = None
-		current_text_parts = []
-
-		line_regex = re.compile(r"^\[((?:\d{2}:)?\d{2}:\d{2}(?:\.\d+)?)\]\s*([^:]+?):\s*(.*)$")
-
-		for i, line in enumerate(lines):
-			line = line.strip()
-			if not line:
-				continue
-
-			match = line_regex.match(line)
-
-			if not match:
-				if current_speaker is not None:
-					segment_text = " ".join(filter(None, current_text_parts))
-					output_lines.append(
-						f"[{current_segment_start_ts_str}] {current_speaker}: {segment_text}"
-					)
-					current_speaker = None
-					current_text_parts = []
-					current_segment_start_ts_str = None
-					current_segment_start_seconds = None
-				output_lines.append(line)
-				continue
-
-			ts_str, speaker, text = match.groups()
-			speaker = speaker.strip()
-			text = text.strip()
-			current_seconds = cls._timestamp_to_seconds(ts_str)
-
-			if current_seconds is None:
-				print(
-					f"Warning: Skipping line {i + 1} due to invalid timestamp format: {line}"
-				)
-				continue
-
-			start_new_segment = False
-			if current_speaker is None:
-				start_new_segment = True
-			elif speaker != current_speaker:
-				start_new_segment = True
-			elif (
-				current_segment_start_seconds is not None
-				and current_seconds - current_segment_start_seconds > max_segment_duration
-			):
-				start_new_segment = True
-
-			if start_new_segment:
-				if current_speaker is not None:
-					segment_text = " ".join(filter(None, current_text_parts))
-					output_lines.append(
-						f"[{current_segment_start_ts_str}] {current_speaker}: {segment_text}"
-					)
-				current_segment_start_ts_str = cls._seconds_to_timestamp(current_seconds)
-				current_segment_start_seconds = current_seconds
-				current_speaker = speaker
-				current_text_parts = [text]
-			else:
-				if text:
-					current_text_parts.append(text)
-
-		if current_speaker is not None:
-			segment_text = " ".join(filter(None, current_text_parts))
-			output_lines.append(f"[{current_segment_start_ts_str}] {current_speaker}: {segment_text}")
-
+		for i, line in enumerate(input_text.strip().splitlines()):
+			output_lines += merger.feed(line, i + 1)
+		output_lines += merger.close()
 		return "\n".join(output_lines)
 
 	@classmethod
 	def _structured_segments(
 		cls, transcript: str
 	) -> List[Tuple[Segment, str, str]]:
-		dialogue_regex = re.compile(
-			r"^\[((?:\d{2}:)?\d{2}:\d{2}(?:\.\d+)?)\]\s*([^:]+?):\s*(.*)$"
-		)
-		non_dialogue_regex = re.compile(r"^\[((?:\d{2}:)?\d{2}:\d{2}(?:\.\d+)?)\]\s*(.*)$")
-
-		parsed_rows: List[tuple[int, str, str]] = []
-		for line in transcript.splitlines():
-			stripped = line.strip()
-			if not stripped or stripped == "[END]":
-				continue
-
-			matched = dialogue_regex.match(stripped)
-			if matched:
-				ts_str, speaker, text = matched.groups()
-				start = cls._timestamp_to_seconds(ts_str)
-				if start is None:
-					continue
-				parsed_rows.append((start, speaker.strip(), text.strip()))
-				continue
-
-			generic = non_dialogue_regex.match(stripped)
-			if generic:
-				ts_str, text = generic.groups()
-				start = cls._timestamp_to_seconds(ts_str)
-				if start is None:
-					continue
-				parsed_rows.append((start, "SOUND", text.strip()))
-
-		if not parsed_rows:
-			return []
-
+		builder = SegmentBuilder()
 		output: List[Tuple[Segment, str, str]] = []
-		for idx, (start, speaker, text) in enumerate(parsed_rows):
-			if idx + 1 < len(parsed_rows):
-				end = parsed_rows[idx + 1][0]
-				if end <= start:
-					end = start + 1
-			else:
-				end = start + 2
-			output.append((Segment(float(start), float(end)), speaker, text))
-		return output
+		for line in transcript.splitlines():
+			output += builder.feed(line)
+		return output + builder.close()
 
 	def inference(self, audio: Any) -> Any:
-		print("==============Start Online LLM (Gemini) ASR + Diarization==============")
+		with self.request_slots:
+			return self._generate(audio)
+
+	def run_streaming(self, audio: str, on_segments: Callable[[List[Tuple[Segment, str, str]]], None]) -> List[Tuple[Segment, str, str]]:
+		"""
+		Like run(), but streams the response and calls on_segments with all segments finalized so
+		far whenever more of them are, well before the full transcript is in.
+		"""
+		self.setup_model_if_needed()
+		with RECORDER.model_call(type(self).__name__, audio_seconds(audio)), self.request_slots:
+			raw, start_time = self._generate(audio, on_segments, stream=True)
+			return self.parse_output(raw, start_time)
+
+	def _generate(self, audio: Any, on_segments=None, stream: bool | None = None) -> Any:
+		self.log("==============Start Online LLM (Gemini) ASR + Diarization==============")
 		start_time = time.time()
 
 		if not isinstance(audio, str):
 			raise TypeError("OnlineLLMTranscription expects an audio file path as input.")
+		if stream is None:
+			stream = getattr(self.args, "online_llm_stream", False)
 
 		if self.model["provider"] == "google_genai":
 			client = self.model["client"]
-			uploaded_file = client.files.upload(file=audio)
-			response = client.models.generate_content(
+			uploaded_file = self._upload(audio)
+			if stream:
+				return self._call(lambda: self._consume_stream(
+					client.models.generate_content_stream(
+						model="gemini-2.5-pro",
+						contents=[prompt, uploaded_file],
+					),
+					start_time,
+					on_segments,
+				)), start_time
+			response = self._call(lambda: client.models.generate_content(
 				model="gemini-2.5-pro",
 				contents=[prompt, uploaded_file],
-			)
+			))
 			return (response.text or ""), start_time
 
 		genai_legacy = self.model["module"]
-		uploaded_file = genai_legacy.upload_file(path=audio)
+		uploaded_file = self._upload(audio)
 		model = genai_legacy.GenerativeModel("gemini-2.5-pro")
-		response = model.generate_content([prompt, uploaded_file])
+		if stream:
+			return self._call(lambda: self._consume_stream(
+				model.generate_content([prompt, uploaded_file], stream=True),
+				start_time,
+				on_segments,
+			)), start_time
+		response = self._call(lambda: model.generate_content([prompt, uploaded_file]))
 		return (getattr(response, "text", "") or ""), start_time
 
+	@staticmethod
+	def _chunk_text(chunk) -> str:
+		try:
+			return chunk.text or ""
+		except (AttributeError, ValueError):
+			# The legacy SDK raises on chunks without text parts (e.g. the final usage chunk)
+			return ""
+
+	def _consume_stream(self, response, start_time: float, on_segments=None) -> str:
+		"""
+		Reads a streamed response to the end, parsing it as it arrives.
+		on_segments: called with all segments finalized so far each time new ones are
+		return: the full response text, for parse_output
+		"""
+		parser = TranscriptStream(max_segment_duration=30)
+		text_parts = []
+		segments: List[Tuple[Segment, str, str]] = []
+		for chunk in response:
+			text = self._chunk_text(chunk)
+			if not text:
+				continue
+			text_parts.append(text)
+			finalized = parser.feed(text)
+			if not finalized:
+				continue
+			if not segments:
+				self.log(f"First segment after {time.time() - start_time:.2f}s")
+			segments += finalized
+			if on_segments is not None:
+				on_segments(list(segments))
+		return "".join(text_parts)
+
+	def _remote_file_api(self):
+		"""
+		return: (upload(path), get(name), delete(name)) for the active SDK
+		"""
+		if self.model["provider"] == "google_genai":
+			files = self.model["client"].files
+			return (
+				lambda path: files.upload(file=path),
+				lambda name: files.get(name=name),
+				lambda name: files.delete(name=name),
+			)
+		genai_legacy = self.model["module"]
+		return (
+			lambda path: genai_legacy.upload_file(path=path),
+			lambda name: genai_legacy.get_file(name),
+			lambda name: genai_legacy.delete_file(name),
+		)
+
+	@staticmethod
+	def _expiry(remote_file) -> float:
+		expiration = getattr(remote_file, "expiration_time", None)
+		if hasattr(expiration, "timestamp"):
+			return expiration.timestamp()
+		# The Files API keeps uploads for 48 hours
+		return time.time() + 47 * 3600
+
+	def _upload(self, audio: str):
+		"""
+		Uploads audio, or reuses a still-valid upload of the same content from the upload cache.
+		"""
+		upload, get, _ = self._remote_file_api()
+		if self.upload_cache is None:
+			return self._call(lambda: upload(audio))
+
+		audio_hash = file_sha256(audio)
+		entry = self.upload_cache.get(audio_hash)
+		if entry is not None:
+			try:
+				remote_file = self._call(lambda: get(entry["name"]))
+				state = getattr(getattr(remote_file, "state", None), "name", "ACTIVE")
+				if state == "ACTIVE":
+					self.log(f"Reusing upload {entry['name']} for {os.path.basename(audio)}")
+					return remote_file
+			except Exception as exc:
+				self.log(f"Cached upload {entry['name']} is gone ({type(exc).__name__}); uploading again")
+			self.upload_cache.remove(audio_hash)
+
+		remote_file = self._call(lambda: upload(audio))
+		self.upload_cache.put(audio_hash, {
+			"name": remote_file.name,
+			"provider": self.model["provider"],
+			"source": os.path.basename(audio),
+			"size": os.path.getsize(audio),
+			"expires": self._expiry(remote_file),
+		})
+		return remote_file
+
+	def cleanup_uploads(self, unused_sec: float = 24 * 3600) -> int:
+		"""
+		Forgets expired uploads and deletes remote files not used for unused_sec.
+		return: number of entries removed
+		"""
+		self.setup_model_if_needed()
+		if self.upload_cache is None:
+			return 0
+		_, _, delete = self._remote_file_api()
+		now = time.time()
+		removed = 0
+		for audio_hash, entry in self.upload_cache.entries().items():
+			if entry.get("provider") not in (None, self.model["provider"]):
+				continue
+			if entry.get("expires", 0) > now and now - entry.get("last_used", 0) < unused_sec:
+				continue
+			if entry.get("expires", 0) > now:
+				try:
+					self._call(lambda name=entry["name"]: delete(name))
+				except Exception as exc:
+					# Already gone remotely counts as deleted
+					if getattr(exc, "code", None) != 404 and getattr(exc, "status_code", None) != 404:
+						self.log(f"Could not delete {entry['name']}: {type(exc).__name__}: {exc}")
+						continue
+			self.upload_cache.remove(audio_hash)
+			removed += 1
+		self.log(f"Upload cleanup removed {removed} entr{'y' if removed == 1 else 'ies'}")
+		return removed
+
+	def _call(self, fn):
+		"""
+		Runs one API request under the rate limiter, retrying timeouts, 429s and 5xx errors.
+		"""
+		return call_with_retry(
+			fn,
+			max_retries=getattr(self.args, "online_llm_retries", 5),
+			rate_limiter=self.rate_limiter,
+			on_retry=lambda exc, attempt, delay: self.log(
+				f"Gemini request failed ({type(exc).__name__}: {exc}); retry {attempt} in {delay:.1f}s"
+			),
+		)
+
+	def run_chunks(self, pieces: List[Tuple[str, float]], overlap_sec: float) -> List[Tuple[Segment, str, str]]:
+		"""
+		Transcribes the pieces of one long recording in parallel and stitches them back together.
+		Pieces share the instance's request slots, so files and pieces together never exceed
+		args.online_llm_concurrency requests in flight.
+		pieces: (piece path, start offset in seconds) as written by AudioInput.split_for_upload
+		return: list of (Segment, speaker, text) on the original timeline, speakers reconciled across pieces
+		"""
+		if len(pieces) == 1:
+			return self.run(pieces[0][0])
+		self.setup_model_if_needed()
+		results = [None] * len(pieces)
+		for (k, _), segments, error in run_concurrently(
+			lambda item: self.run(item[1][0]),
+			enumerate(pieces),
+			getattr(self.args, "online_llm_concurrency", 1),
+		):
+			if error is not None:
+				raise error
+			results[k] = segments
+		return stitch_chunks([(offset, results[k]) for k, (_, offset) in enumerate(pieces)], overlap_sec)
+
+	def run_many(self, audio_paths, run=None):
+		"""
+		Transcribes several files with up to args.online_llm_concurrency requests in flight.
+		audio_paths: iterable of file paths, consumed lazily as slots free up
+		run: callable transcribing one path (default: self.run)
+		return: iterator of (path, segments or None, error or None, wall seconds) in completion order
+		"""
+		self.setup_model_if_needed()
+		run = run or self.run
+
+		def timed_run(path):
+			start = time.perf_counter()
+			return run(path), time.perf_counter() - start
+
+		for path, result, error in run_concurrently(
+			timed_run, audio_paths, getattr(self.args, "online_llm_concurrency", 1)
+		):
+			if error is not None:
+				yield path, None, error, None
+			else:
+				yield path, result[0], None, result[1]
+
 	def parse_output(self, raw_output: Any, start_time: float) -> List[Tuple[Segment, str, str]]:
 		processed_transcript = self._process_transcript(raw_output, max_segment_duration=30)
 		structured = self._structured_segments(processed_transcript)
-		print(f"==============Online LLM done in {time.time() - start_time:.2f}s.==============")
+		self.log(f"==============Online LLM done in {time.time() - start_time:.2f}s.==============")
 		return structured
\ No newline at end of file
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import re
+from typing import List, Tuple
+
+from pyannote.core import Segment
+
+TIMESTAMP = r"((?:\d{2}:)?\d{2}:\d{2}(?:\.\d+)?)"
+DIALOGUE_REGEX = re.compile(r"^\[" + TIMESTAMP + r"\]\s*([^:]+?):\s*(.*)$")
+NON_DIALOGUE_REGEX = re.compile(r"^\[" + TIMESTAMP + r"\]\s*(.*)$")
+
+
+def timestamp_to_seconds(ts_str: str) -> int | None:
+	try:
+		ts_str = ts_str.split(".")[0]
+		parts = list(map(int, ts_str.split(":")))
+		if len(parts) == 3:
+			h, m, s = parts
+			return h * 3600 + m * 60 + s
+		if len(parts) == 2:
+			m, s = parts
+			return m * 60 + s
+		return None
+	except (ValueError, AttributeError, IndexError):
+		return None
+
+
+def seconds_to_timestamp(total_seconds: int | None) -> str:
+	if total_seconds is None or total_seconds < 0:
+		total_seconds = 0
+	hours, remainder = divmod(total_seconds, 3600)
+	minutes, seconds = divmod(remainder, 60)
+	return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
+
+
+class TurnMerger:
+	"""
+	Merges consecutive `[mm:ss] Speaker: text` lines of one speaker into turns of at most
+	max_segment_duration seconds, one input line at a time. Lines that are not dialogue close
+	the open turn and are passed through as they are.
+	"""
+	def __init__(self, max_segment_duration: int = 30) -> None:
+		self.max_segment_duration = max_segment_duration
+		self.start_ts_str = None
+		self.start_seconds = None
+		self.speaker = None
+		self.text_parts = []
+
+	def _close_turn(self) -> List[str]:
+		if self.speaker is None:
+			return []
+		segment_text = " ".join(filter(None, self.text_parts))
+		closed = f"[{self.start_ts_str}] {self.speaker}: {segment_text}"
+		self.speaker = None
+		self.text_parts = []
+		self.start_ts_str = None
+		self.start_seconds = None
+		return [closed]
+
+	def feed(self, line: str, line_no: int) -> List[str]:
+		"""
+		return: output lines completed by this input line
+		"""
+		line = line.strip()
+		if not line:
+			return []
+
+		match = DIALOGUE_REGEX.match(line)
+		if not match:
+			return self._close_turn() + [line]
+
+		ts_str, speaker, text = match.groups()
+		speaker = speaker.strip()
+		text = text.strip()
+		current_seconds = timestamp_to_seconds(ts_str)
+
+		if current_seconds is None:
+			print(
+				f"Warning: Skipping line {line_no} due to invalid timestamp format: {line}"
+			)
+			return []
+
+		start_new_segment = (
+			self.speaker is None
+			or speaker != self.speaker
+			or (
+				self.start_seconds is not None
+				and current_seconds - self.start_seconds > self.max_segment_duration
+			)
+		)
+		if not start_new_segment:
+			if text:
+				self.text_parts.append(text)
+			return []
+
+		closed = self._close_turn()
+		self.start_ts_str = seconds_to_timestamp(current_seconds)
+		self.start_seconds = current_seconds
+		self.speaker = speaker
+		self.text_parts = [text]
+		return closed
+
+	def close(self) -> List[str]:
+		return self._close_turn()
+
+
+class SegmentBuilder:
+	"""
+	Turns merged transcript lines into (Segment, speaker, text), one line at a time. A row ends
+	where the next one starts, so each row is final as soon as the next row arrives; the last
+	one is given 2 seconds by close().
+	"""
+	def __init__(self) -> None:
+		self.pending = None
+
+	@staticmethod
+	def _parse(line: str) -> Tuple[int, str, str] | None:
+		stripped = line.strip()
+		if not stripped or stripped == "[END]":
+			return None
+
+		matched = DIALOGUE_REGEX.match(stripped)
+		if matched:
+			ts_str, speaker, text = matched.groups()
+			start = timestamp_to_seconds(ts_str)
+			return None if start is None else (start, speaker.strip(), text.strip())
+
+		generic = NON_DIALOGUE_REGEX.match(stripped)
+		if generic:
+			ts_str, text = generic.groups()
+			start = timestamp_to_seconds(ts_str)
+			return None if start is None else (start, "SOUND", text.strip())
+		return None
+
+	def feed(self, line: str) -> List[Tuple[Segment, str, str]]:
+		"""
+		return: the rows finalized by this line (at most one)
+		"""
+		row = self._parse(line)
+		if row is None:
+			return []
+		finished, self.pending = self.pending, row
+		if finished is None:
+			return []
+		start, speaker, text = finished
+		end = row[0]
+		if end <= start:
+			end = start + 1
+		return [(Segment(float(start), float(end)), speaker, text)]
+
+	def close(self) -> List[Tuple[Segment, str, str]]:
+		if self.pending is None:
+			return []
+		start, speaker, text = self.pending
+		self.pending = None
+		return [(Segment(float(start), float(start + 2)), speaker, text)]
+
+
+class TranscriptStream:
+	"""
+	Incremental parser for a transcript that arrives in pieces (a streamed response): feed()
+	takes text as it comes and returns the segments that can no longer change; close() returns
+	the rest. Over the whole text this yields exactly what TurnMerger followed by SegmentBuilder
+	give on the complete response.
+	"""
+	def __init__(self, max_segment_duration: int = 30) -> None:
+		self.merger = TurnMerger(max_segment_duration)
+		self.builder = SegmentBuilder()
+		self._buffer = ""
+		self._line_no = 0
+
+	def _feed_line(self, line: str) -> List[Tuple[Segment, str, str]]:
+		# Line numbers count from the first non-blank line, as on the stripped full text
+		if self._line_no == 0 and not line.strip():
+			return []
+		self._line_no += 1
+		segments = []
+		for merged in self.merger.feed(line, self._line_no):
+			for piece in merged.splitlines():
+				segments += self.builder.feed(piece)
+		return segments
+
+	def feed(self, text: str) -> List[Tuple[Segment, str, str]]:
+		self._buffer += text
+		lines = self._buffer.splitlines(keepends=True)
+		self._buffer = ""
+		# Keep an unterminated last line (or a "\r" that may be the start of "\r\n") for later
+		if lines and (lines[-1].splitlines()[0] == lines[-1] or lines[-1].endswith("\r")):
+			self._buffer = lines.pop()
+		segments = []
+		for line in lines:
+			segments += self._feed_line(line)
+		return segments
+
+	def close(self) -> List[Tuple[Segment, str, str]]:
+		segments = []
+		for line in self._buffer.splitlines():
+			segments += self._feed_line(line)
+		self._buffer = ""
+		for merged in self.merger.close():
+			for piece in merged.splitlines():
+				segments += self.builder.feed(piece)
+		return segments + self.builder.close()
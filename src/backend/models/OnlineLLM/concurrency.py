@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator
+
+# HTTP statuses worth retrying: timeouts, rate limiting and transient server errors
+RETRIABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: on average `rate` acquisitions per second, with bursts of up
+    to `capacity`. A rate <= 0 disables limiting.
+    """
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_sec = (tokens - self._tokens) / self.rate
+            time.sleep(wait_sec)
+
+
+def status_code(exc: BaseException) -> int | None:
+    """
+    HTTP status of an SDK/transport error (google-genai APIError.code, HTTP client
+    status_code, or google.api_core .code), if it carries one.
+    """
+    for attr in ("code", "status_code"):
+        value = getattr(exc, attr, None)
+        value = value() if callable(value) else value
+        value = getattr(value, "value", value)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retriable(exc: BaseException) -> bool:
+    status = status_code(exc)
+    if status is not None:
+        return status in RETRIABLE_STATUS
+    # Connection resets, timeouts and other transport failures carry no status
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    name = type(exc).__name__
+    return any(word in name for word in ("Timeout", "Connect", "Transport", "RemoteProtocol", "ServiceUnavailable"))
+
+
+def call_with_retry(
+    fn: Callable[[], Any],
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    rate_limiter: TokenBucket | None = None,
+    on_retry: Callable[[BaseException, int, float], None] | None = None
+) -> Any:
+    """
+    Calls fn, retrying retriable errors with exponential backoff and full jitter.
+    Every attempt first takes a token from rate_limiter, if given.
+    on_retry: called with (error, attempt number, delay) before each wait
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return fn()
+        except Exception as exc:
+            attempt += 1
+            if attempt > max_retries or not is_retriable(exc):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            if on_retry is not None:
+                on_retry(exc, attempt, delay)
+            time.sleep(delay)
+
+
+def run_concurrently(
+    fn: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_concurrency: int
+) -> Iterator[tuple[Any, Any, BaseException | None]]:
+    """
+    Applies fn to items on up to max_concurrency threads and yields (item, result, error)
+    in completion order. Items are pulled lazily, only when a slot frees up, so a generator
+    that claims work (e.g. queue leases) never claims more than is in flight.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="online-llm") as pool:
+        in_flight = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < max(1, max_concurrency):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight[pool.submit(fn, item)] = item
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                error = future.exception()
+                yield item, (None if error is not None else future.result()), error
@@ -0,0 +1,88 @@
+from typing import List, Tuple
+
+from pyannote.core import Segment
+
+# Labels that mark non-speech events rather than a speaker; never remapped
+NON_SPEAKER_LABELS = {"SOUND"}
+
+
+def _intersection(a_start: float, a_end: float, b_start: float, b_end: float) -> float:
+    return max(0.0, min(a_end, b_end) - max(a_start, b_start))
+
+
+def match_speakers(
+    previous: List[Tuple[Segment, str, str]],
+    current: List[Tuple[Segment, str, str]],
+    region: Tuple[float, float]
+) -> dict:
+    """
+    Maps the speaker labels of `current` onto those of `previous` from how much their turns
+    coincide inside `region`, the stretch of audio both chunks transcribed. Pairs are taken
+    greedily by overlap, one-to-one.
+    return: {current label: previous label} for the labels that could be matched
+    """
+    region_start, region_end = region
+    weights = {}
+    for prev_seg, prev_spk, _ in previous:
+        if prev_spk in NON_SPEAKER_LABELS or _intersection(prev_seg.start, prev_seg.end, region_start, region_end) <= 0:
+            continue
+        for cur_seg, cur_spk, _ in current:
+            if cur_spk in NON_SPEAKER_LABELS:
+                continue
+            start = max(prev_seg.start, cur_seg.start, region_start)
+            end = min(prev_seg.end, cur_seg.end, region_end)
+            if end > start:
+                weights[(cur_spk, prev_spk)] = weights.get((cur_spk, prev_spk), 0.0) + (end - start)
+
+    mapping = {}
+    used = set()
+    for (cur_spk, prev_spk), _ in sorted(weights.items(), key=lambda kv: -kv[1]):
+        if cur_spk not in mapping and prev_spk not in used:
+            mapping[cur_spk] = prev_spk
+            used.add(prev_spk)
+    return mapping
+
+
+def stitch_chunks(
+    chunks: List[Tuple[float, List[Tuple[Segment, str, str]]]],
+    overlap_sec: float
+) -> List[Tuple[Segment, str, str]]:
+    """
+    Joins per-chunk transcripts onto one timeline.
+    chunks: (start offset in seconds, segments relative to the chunk) in order; every chunk but
+        the last also covers the first overlap_sec seconds of the next one
+    Speaker labels of each chunk are renamed to the labels already used for the same voices
+    (matched in the overlap); the overlap itself is taken from the earlier chunk up to its
+    midpoint and from the later chunk after it.
+    return: list of (Segment, speaker, text) on the original timeline
+    """
+    output: List[Tuple[Segment, str, str]] = []
+    for k, (offset, segments) in enumerate(chunks):
+        shifted = [(Segment(seg.start + offset, seg.end + offset), spk, text) for seg, spk, text in segments]
+        if k == 0:
+            output = shifted
+            continue
+
+        mapping = match_speakers(output, shifted, (offset, offset + overlap_sec))
+        taken = set(mapping.values())
+        for _, spk, _ in shifted:
+            if spk in NON_SPEAKER_LABELS or spk in mapping:
+                continue
+            # Not heard in the overlap: keep the chunk's own label unless a matched voice already uses it
+            label = spk
+            suffix = 2
+            while label in taken:
+                label = f"{spk} ({suffix})"
+                suffix += 1
+            mapping[spk] = label
+            taken.add(label)
+        renamed = [(seg, mapping.get(spk, spk), text) for seg, spk, text in shifted]
+
+        cut = offset + overlap_sec / 2.0
+        output = [item for item in output if item[0].start < cut]
+        tail = [item for item in renamed if item[0].start >= cut]
+        if output and tail and output[-1][0].end > tail[0][0].start:
+            seg, spk, text = output[-1]
+            output[-1] = (Segment(seg.start, max(seg.start, tail[0][0].start)), spk, text)
+        output.extend(tail)
+    return output
@@ -1,6 +1,6 @@
 from typing import Any, List, Tuple
 from pyannote.core import Segment
-from models.base import BaseModel
+from models.base import BaseModel, group_by_length
 import time
 import torch
 import numpy as np
@@ -11,9 +11,9 @@ class AutomaticSpeechRecognition(BaseModel):
         from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor
 
         model_id = "kotoba-tech/kotoba-whisper-v2.0"
-        torch_dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
+        self.device = torch.device(self.get_device("asr_device"))
+        torch_dtype = torch.bfloat16 if self.device.type == "cuda" else torch.float32
         self.model_dtype = torch_dtype
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.processor = AutoProcessor.from_pretrained(model_id)
 
         model = AutoModelForSpeechSeq2Seq.from_pretrained(
@@ -24,15 +24,9 @@ class AutomaticSpeechRecognition(BaseModel):
         )
         return model.to(self.device)
 
-    def inference(self, audio: Any) -> Any:
-        print("==============Start ASR==============")
-        start_time = time.time()
-        waveform = audio
-        if isinstance(waveform, np.ndarray):
-            waveform = waveform.astype(np.float32, copy=False)
-
+    def _generate(self, waveforms: List[Any]) -> List[str]:
         inputs = self.processor(
-            waveform,
+            waveforms,
             sampling_rate=16000,
             return_tensors="pt",
         )
@@ -45,7 +39,16 @@ class AutomaticSpeechRecognition(BaseModel):
             language=language,
             task="transcribe",
         )
-        text = self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0].strip()
+        return [text.strip() for text in self.processor.batch_decode(generated_ids, skip_special_tokens=True)]
+
+    def inference(self, audio: Any) -> Any:
+        self.log("==============Start ASR==============")
+        start_time = time.time()
+        waveform = audio
+        if isinstance(waveform, np.ndarray):
+            waveform = waveform.astype(np.float32, copy=False)
+
+        text = self._generate([waveform])[0]
 
         duration = len(waveform) / 16000.0 if hasattr(waveform, "__len__") else 0.0
         return {
@@ -53,7 +56,8 @@ class AutomaticSpeechRecognition(BaseModel):
             "duration": duration,
         }, start_time
 
-    def parse_output(self, raw_outputs: Any, start_time: float) -> List[Tuple[Segment, str]]:
+    @staticmethod
+    def _to_segments(raw_outputs: Any) -> List[Tuple[Segment, str]]:
         segments: List[Tuple[Segment, str]] = []
 
         if isinstance(raw_outputs, dict):
@@ -61,7 +65,29 @@ class AutomaticSpeechRecognition(BaseModel):
             duration = float(raw_outputs.get("duration", 0.0))
             if text:
                 segments.append((Segment(0.0, duration), text))
+        return segments
+
+    def parse_output(self, raw_outputs: Any, start_time: float) -> List[Tuple[Segment, str]]:
+        segments = self._to_segments(raw_outputs)
 
-        print(segments)
-        print(f"==============ASR done in {time.time() - start_time:.2f}s.==============")
+        self.log(segments, level=2)
+        self.log(f"==============ASR done in {time.time() - start_time:.2f}s.==============")
         return segments
+
+    def run_batch(self, audios: List[Any], batch_size: int = 8) -> List[List[Tuple[Segment, str]]]:
+        self.setup_model_if_needed()
+        self.log(f"==============Start batched ASR ({len(audios)} chunks)==============")
+        start_time = time.time()
+
+        waveforms = [np.asarray(audio, dtype=np.float32) for audio in audios]
+        outputs: List[List[Tuple[Segment, str]]] = [[] for _ in waveforms]
+        for indices in group_by_length([len(w) for w in waveforms], batch_size):
+            texts = self._generate([waveforms[i] for i in indices])
+            for i, text in zip(indices, texts):
+                outputs[i] = self._to_segments({
+                    "text": text,
+                    "duration": len(waveforms[i]) / 16000.0,
+                })
+
+        self.log(f"==============Batched ASR done in {time.time() - start_time:.2f}s.==============")
+        return outputs
@@ -1,20 +1,32 @@
 from typing import Any, List, Tuple
-from transformers import pipeline
 from pyannote.core import Segment
-from models.base import BaseModel
+from models.base import BaseModel, group_by_length
 import time
-import whisper
+import torch
 import os
 import numpy as np
 
+# Whisper timestamp tokens are spaced 20 ms apart.
+TIME_PRECISION = 0.02
+# whisper.transcribe's default quality gates.
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
 
 class AutomaticSpeechRecognition(BaseModel):
     def setup_model(self):
+        import whisper
+
         # specify where to save the model
-        return whisper.load_model("large-v3", download_root=os.environ.get("HF_HOME", "./models"))
+        return whisper.load_model(
+            "large-v3",
+            device=self.get_device("asr_device"),
+            download_root=os.environ.get("HF_HOME", "./models")
+        )
     
     def inference(self, audio: Any) -> Any:
-        print("==============Start ASR==============")
+        self.log("==============Start ASR==============")
         start_time = time.time()
 
         if isinstance(audio, np.ndarray):
@@ -34,6 +46,102 @@ class AutomaticSpeechRecognition(BaseModel):
             end   = seg["end"]
             text  = seg["text"].strip()
             segments.append((Segment(start, end), text))
-        print(segments)
-        print(f"==============ASR done in {time.time() - start_time:.2f}s.==============")
-        return segments
\ No newline at end of file
+        self.log(segments, level=2)
+        self.log(f"==============ASR done in {time.time() - start_time:.2f}s.==============")
+        return segments
+
+    @staticmethod
+    def _timestamp_segments(tokens: List[int], tokenizer: Any, duration: float) -> List[Tuple[Segment, str]]:
+        """
+        Splits a decoded token sequence into segments at its timestamp tokens,
+        mirroring how whisper.transcribe builds segments for a single 30 s window.
+        """
+        segments: List[Tuple[Segment, str]] = []
+        seg_start = None
+        text_tokens: List[int] = []
+        for token in tokens:
+            if token < tokenizer.timestamp_begin:
+                text_tokens.append(token)
+                continue
+            timestamp = min((token - tokenizer.timestamp_begin) * TIME_PRECISION, duration)
+            if seg_start is not None and text_tokens:
+                text = tokenizer.decode(text_tokens).strip()
+                if text:
+                    segments.append((Segment(seg_start, timestamp), text))
+                text_tokens = []
+                seg_start = None
+            else:
+                seg_start = timestamp
+        if text_tokens:
+            text = tokenizer.decode(text_tokens).strip()
+            if text:
+                segments.append((Segment(seg_start or 0.0, duration), text))
+        return segments
+
+    def _window_mel(self, whisper: Any, waveform: np.ndarray) -> torch.Tensor:
+        """
+        Log-mel of a chunk of up to 30 s exactly as whisper.transcribe builds its first window:
+        computed over the audio followed by 30 s of zeros (so the log-mel floor and the frames
+        at the end see the same padding), cut to the chunk's own frames, then padded to N_FRAMES.
+        """
+        mel = whisper.log_mel_spectrogram(
+            waveform, self.model.dims.n_mels, padding=whisper.audio.N_SAMPLES, device=self.model.device
+        )
+        content_frames = mel.shape[-1] - whisper.audio.N_FRAMES
+        return whisper.pad_or_trim(mel[:, :min(whisper.audio.N_FRAMES, content_frames)], whisper.audio.N_FRAMES)
+
+    def run_batch(self, audios: List[Any], batch_size: int = 8) -> List[List[Tuple[Segment, str]]]:
+        """
+        Decodes chunks of up to 30 s together in one greedy batched decoder pass per group.
+        Longer chunks need whisper's sliding window, and chunks whose greedy result fails
+        whisper.transcribe's quality gates need its temperature fallback; both go through
+        run() instead.
+        """
+        import whisper
+
+        self.setup_model_if_needed()
+        self.log(f"==============Start batched ASR ({len(audios)} chunks)==============")
+        start_time = time.time()
+
+        waveforms = [np.asarray(audio, dtype=np.float32) for audio in audios]
+        outputs: List[List[Tuple[Segment, str]]] = [[] for _ in waveforms]
+
+        batchable = []
+        for i, waveform in enumerate(waveforms):
+            if len(waveform) <= whisper.audio.N_SAMPLES:
+                batchable.append(i)
+            else:
+                outputs[i] = self.run(waveform)
+
+        fp16 = self.model.device.type == "cuda"
+        options = whisper.DecodingOptions(
+            language=self.args.openai_language,
+            task="transcribe",
+            fp16=fp16,
+        )
+        tokenizer = whisper.tokenizer.get_tokenizer(
+            self.model.is_multilingual,
+            num_languages=self.model.num_languages,
+            language=self.args.openai_language,
+            task="transcribe",
+        )
+        for group in group_by_length([len(waveforms[i]) for i in batchable], batch_size):
+            indices = [batchable[g] for g in group]
+            mel = torch.stack([self._window_mel(whisper, waveforms[i]) for i in indices])
+            results = whisper.decode(self.model, mel, options)
+            for i, result in zip(indices, results):
+                # Same no-speech gate whisper.transcribe applies with its default thresholds.
+                if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob <= LOGPROB_THRESHOLD:
+                    continue
+                if result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD:
+                    # Likely a repetition loop or a bad guess: redo it with temperature fallback
+                    outputs[i] = self.run(waveforms[i])
+                    continue
+                outputs[i] = self._timestamp_segments(
+                    result.tokens,
+                    tokenizer,
+                    len(waveforms[i]) / float(whisper.audio.SAMPLE_RATE),
+                )
+
+        self.log(f"==============Batched ASR done in {time.time() - start_time:.2f}s.==============")
+        return outputs
@@ -1,6 +1,6 @@
 from typing import Any, List, Tuple
 from pyannote.core import Segment
-from models.base import BaseModel
+from models.base import BaseModel, group_by_length
 import time
 import torch
 import soundfile as sf
@@ -15,8 +15,8 @@ class AutomaticSpeechRecognition(BaseModel):
                 "Qwen3-ASR requires `qwen-asr` package. Install with: pip install -U qwen-asr"
             ) from exc
 
-        dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
-        device_map = "cuda:0" if torch.cuda.is_available() else "cpu"
+        device_map = self.get_device("asr_device")
+        dtype = torch.bfloat16 if device_map.startswith("cuda") else torch.float32
 
         return Qwen3ASRModel.from_pretrained(
             "Qwen/Qwen3-ASR-1.7B",
@@ -32,7 +32,7 @@ class AutomaticSpeechRecognition(BaseModel):
         )
 
     def inference(self, audio: Any) -> Any:
-        print("==============Start ASR==============")
+        self.log("==============Start ASR==============")
         start_time = time.time()
         results = self.model.transcribe(
             audio=audio,
@@ -67,6 +67,31 @@ class AutomaticSpeechRecognition(BaseModel):
 
         return parsed
 
+    def _to_segments(self, result: Any, audio: Any) -> List[Tuple[Segment, str]]:
+        segments: List[Tuple[Segment, str]] = []
+
+        text = str(getattr(result, "text", "")).strip()
+        ts_list = getattr(result, "time_stamps", None)
+        parsed_ts = self._parse_qwen_timestamps(ts_list)
+
+        if parsed_ts and text:
+            first_start = parsed_ts[0][0]
+            last_end = parsed_ts[-1][1]
+            segments.append((Segment(first_start, last_end), text))
+        elif text:
+            duration = 0.0
+            if isinstance(audio, str):
+                try:
+                    info = sf.info(audio)
+                    duration = float(info.duration)
+                except RuntimeError:
+                    duration = 0.0
+            elif isinstance(audio, tuple) and len(audio) == 2:
+                waveform, sampling_rate = audio
+                duration = len(waveform) / float(sampling_rate)
+            segments.append((Segment(0.0, duration), text))
+        return segments
+
     def parse_output(self, raw_outputs: Any, start_time: float) -> List[Tuple[Segment, str]]:
         segments: List[Tuple[Segment, str]] = []
 
@@ -74,25 +99,30 @@ class AutomaticSpeechRecognition(BaseModel):
         audio = raw_outputs.get("audio") if isinstance(raw_outputs, dict) else None
 
         if isinstance(results, list) and len(results) > 0:
-            result = results[0]
-            text = str(getattr(result, "text", "")).strip()
-            ts_list = getattr(result, "time_stamps", None)
-            parsed_ts = self._parse_qwen_timestamps(ts_list)
-
-            if parsed_ts and text:
-                first_start = parsed_ts[0][0]
-                last_end = parsed_ts[-1][1]
-                segments.append((Segment(first_start, last_end), text))
-            elif text:
-                duration = 0.0
-                if isinstance(audio, str):
-                    try:
-                        info = sf.info(audio)
-                        duration = float(info.duration)
-                    except RuntimeError:
-                        duration = 0.0
-                segments.append((Segment(0.0, duration), text))
-
-        print(segments)
-        print(f"==============ASR done in {time.time() - start_time:.2f}s.==============")
+            segments = self._to_segments(results[0], audio)
+
+        self.log(segments, level=2)
+        self.log(f"==============ASR done in {time.time() - start_time:.2f}s.==============")
         return segments
+
+    def run_batch(self, audios: List[Any], batch_size: int = 8) -> List[List[Tuple[Segment, str]]]:
+        """
+        audios: list of (waveform, sampling_rate) tuples or file paths.
+        """
+        self.setup_model_if_needed()
+        self.log(f"==============Start batched ASR ({len(audios)} chunks)==============")
+        start_time = time.time()
+
+        lengths = [len(audio[0]) if isinstance(audio, tuple) else 0 for audio in audios]
+        outputs: List[List[Tuple[Segment, str]]] = [[] for _ in audios]
+        for indices in group_by_length(lengths, batch_size):
+            results = self.model.transcribe(
+                audio=[audios[i] for i in indices],
+                language=self.args.qwen_language,
+                return_time_stamps=True
+            )
+            for i, result in zip(indices, results):
+                outputs[i] = self._to_segments(result, audios[i])
+
+        self.log(f"==============Batched ASR done in {time.time() - start_time:.2f}s.==============")
+        return outputs
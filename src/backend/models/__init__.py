@@ -30,3 +30,58 @@ def get_online_llm_model(args):
 
         return OnlineLLMTranscription(args)
     raise ValueError(f"Unsupported online LLM model: {args.online_llm_model}")
+
+
+class ModelCache:
+    """
+    Keeps loaded models alive between runs, keyed on the arguments that affect model
+    loading, so a long-running process pays each model's startup cost only once.
+    Per-run arguments (languages, num_speakers, ...) are refreshed on every lookup.
+    """
+    ASR_KEYS = ("asr_model_name", "asr_device")
+    SD_KEYS = ("diarization_model_name", "diarization_device")
+    ONLINE_LLM_KEYS = ("online_llm_model",)
+
+    def __init__(self):
+        import threading
+
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _get(self, factory, keys, args):
+        key = (factory.__name__,) + tuple(getattr(args, name, None) for name in keys)
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = factory(args)
+            model = self._models[key]
+        model.args = args
+        return model
+
+    def get_asr_model(self, args):
+        return self._get(get_asr_model, self.ASR_KEYS, args)
+
+    def get_sd_model(self, args):
+        return self._get(get_sd_model, self.SD_KEYS, args)
+
+    def get_online_llm_model(self, args):
+        return self._get(get_online_llm_model, self.ONLINE_LLM_KEYS, args)
+
+    def clear(self) -> None:
+        """
+        Drops every cached model so its (GPU) memory can be reclaimed before loading others.
+        """
+        with self._lock:
+            self._models.clear()
+        import gc
+        import sys
+
+        gc.collect()
+        # Only offline models load torch; online-LLM-only runs must not import it just to clear
+        if "torch" in sys.modules:
+            torch = sys.modules["torch"]
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def loaded(self) -> list:
+        with self._lock:
+            return [list(key) for key in self._models]
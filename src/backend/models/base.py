@@ -1,6 +1,19 @@
 from abc import ABC, abstractmethod
-from typing import Any, Union, Optional
+from typing import Any, Union, Optional, Sequence
+import time
 import numpy as np
+from metrics import RECORDER, audio_seconds, log
+
+
+def group_by_length(lengths: Sequence[int], batch_size: int) -> list[list[int]]:
+    """
+    Groups item indices into batches of similar length to keep padding low.
+    return: list of index lists, each at most batch_size long
+    """
+    batch_size = max(1, int(batch_size))
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
 
 class BaseModel(ABC):
     def __init__(self, args: Any, config: Optional[dict] = None) -> None:
@@ -32,15 +45,44 @@ class BaseModel(ABC):
         """
         pass
 
+    def get_device(self, arg_name: str) -> str:
+        """
+        Returns the device requested by args.<arg_name>, or the first GPU if available, else the CPU.
+        return: device string usable by torch (e.g. "cuda:0", "cpu")
+        """
+        device = getattr(self.args, arg_name, None)
+        if device:
+            return device
+        import torch
+        return "cuda:0" if torch.cuda.is_available() else "cpu"
+
     def setup_model_if_needed(self) -> None:
         """
         If the model has not been initialized, call setup_model.
         """
         if self.model is None:
+            start = time.perf_counter()
             self.model = self.setup_model()
-    
+            RECORDER.record_load(type(self).__name__, time.perf_counter() - start)
+
+    def log(self, message: Any, level: int = 1) -> None:
+        """
+        Prints progress banners (level 1) or full outputs (level 2) according to --verbosity.
+        """
+        log(self.args, message, level)
+
     def run(self, audio: Union[str, np.ndarray]) -> str:
         self.setup_model_if_needed()
-        raw, start_time = self.inference(audio)
-        output = self.parse_output(raw, start_time)
-        return output
\ No newline at end of file
+        with RECORDER.model_call(type(self).__name__, audio_seconds(audio)):
+            raw, start_time = self.inference(audio)
+            output = self.parse_output(raw, start_time)
+        return output
+
+    def run_batch(self, audios: list, batch_size: int = 8) -> list:
+        """
+        Runs inference on several inputs and returns one output per input, in input order.
+        Models that can decode several inputs at once override this; the default runs them one by one.
+        return: list of run() outputs
+        """
+        self.setup_model_if_needed()
+        return [self.run(audio) for audio in audios]
@@ -0,0 +1,116 @@
+import json
+import os
+
+import numpy as np
+import soundfile as sf
+
+# Peaks are stored as signed 8-bit values, like audiowaveform's 8-bit JSON
+PEAK_BITS = 8
+PEAK_SCALE = 2 ** (PEAK_BITS - 1)
+
+
+def samples_per_peak(sampling_rate: int, peaks_per_sec: float) -> int:
+    return max(1, int(round(sampling_rate / peaks_per_sec)))
+
+
+class PeakPyramid:
+    """
+    Block-wise min/max waveform summary at several zoom levels. Level 0 holds one (min, max)
+    pair per samples_per_peak samples (about peaks_per_sec per second); every further level
+    halves the resolution, down to min_peaks pairs. Multi-channel blocks are summarized over
+    all channels.
+    """
+    def __init__(self, sampling_rate: int, peaks_per_sec: float = 20.0, min_peaks: int = 512):
+        self.sampling_rate = sampling_rate
+        self.samples_per_peak = samples_per_peak(sampling_rate, peaks_per_sec)
+        self.min_peaks = min_peaks
+        self.total_samples = 0
+        self._lows: list[np.ndarray] = []
+        self._highs: list[np.ndarray] = []
+        self._carry_low = np.zeros(0, dtype=np.float32)
+        self._carry_high = np.zeros(0, dtype=np.float32)
+
+    def feed(self, block: np.ndarray) -> None:
+        if block.ndim > 1:
+            low, high = block.min(axis=1), block.max(axis=1)
+        else:
+            low = high = block
+        self.total_samples += len(block)
+        low = np.concatenate((self._carry_low, low.astype(np.float32, copy=False)))
+        high = np.concatenate((self._carry_high, high.astype(np.float32, copy=False)))
+        full = len(low) - len(low) % self.samples_per_peak
+        if full:
+            self._lows.append(low[:full].reshape(-1, self.samples_per_peak).min(axis=1))
+            self._highs.append(high[:full].reshape(-1, self.samples_per_peak).max(axis=1))
+        self._carry_low, self._carry_high = low[full:], high[full:]
+
+    @staticmethod
+    def _quantize(values: np.ndarray) -> np.ndarray:
+        return np.clip(np.round(values * PEAK_SCALE), -PEAK_SCALE, PEAK_SCALE - 1).astype(np.int8)
+
+    def finish(self) -> dict:
+        """
+        return: JSON-serializable pyramid; each level's "data" interleaves min and max per peak
+        """
+        lows, highs = list(self._lows), list(self._highs)
+        if len(self._carry_low):
+            lows.append(self._carry_low.min(keepdims=True))
+            highs.append(self._carry_high.max(keepdims=True))
+        low = np.concatenate(lows) if lows else np.zeros(0, dtype=np.float32)
+        high = np.concatenate(highs) if highs else np.zeros(0, dtype=np.float32)
+
+        levels = []
+        samples_per_peak = self.samples_per_peak
+        while True:
+            data = np.empty(2 * len(low), dtype=np.int8)
+            data[0::2] = self._quantize(low)
+            data[1::2] = self._quantize(high)
+            levels.append({"samples_per_peak": samples_per_peak, "length": len(low), "data": data.tolist()})
+            if len(low) <= self.min_peaks:
+                break
+            if len(low) % 2:
+                low, high = np.append(low, low[-1]), np.append(high, high[-1])
+            low = np.minimum(low[0::2], low[1::2])
+            high = np.maximum(high[0::2], high[1::2])
+            samples_per_peak *= 2
+
+        return {
+            "version": 1,
+            "sample_rate": self.sampling_rate,
+            "duration": self.total_samples / float(self.sampling_rate),
+            "bits": PEAK_BITS,
+            "levels": levels,
+        }
+
+
+def compute_peaks(waveform: np.ndarray, sampling_rate: int, peaks_per_sec: float = 20.0) -> dict:
+    pyramid = PeakPyramid(sampling_rate, peaks_per_sec)
+    pyramid.feed(waveform)
+    return pyramid.finish()
+
+
+def file_peaks(path: str, peaks_per_sec: float = 20.0, block_sec: float = 60.0) -> dict:
+    """
+    Peak pyramid of an audio file at its own sampling rate, decoded block by block, for files
+    whose waveform was never loaded (e.g. ones sent to the online LLM).
+    """
+    with sf.SoundFile(path) as audio_file:
+        pyramid = PeakPyramid(audio_file.samplerate, peaks_per_sec)
+        for block in audio_file.blocks(blocksize=max(1, int(block_sec * audio_file.samplerate)), dtype="float32"):
+            pyramid.feed(block)
+    return pyramid.finish()
+
+
+def peaks_current(path: str, source: str, peaks_per_sec: float) -> bool:
+    """
+    Whether the peak file at `path` was written after `source` last changed, at this resolution,
+    so it does not have to be decoded again.
+    """
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source):
+        return False
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            peaks = json.load(f)
+        return peaks["levels"][0]["samples_per_peak"] == samples_per_peak(peaks["sample_rate"], peaks_per_sec)
+    except (OSError, ValueError, KeyError, IndexError, TypeError):
+        return False
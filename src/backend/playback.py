@@ -0,0 +1,67 @@
+import os
+import tempfile
+
+import numpy as np
+import soundfile as sf
+
+from cache import default_file_mode
+
+# --playback_format -> (libsndfile format, subtype, extension, MIME type for the browser)
+PLAYBACK_FORMATS = {
+    "flac": ("FLAC", "PCM_16", ".flac", "audio/flac"),
+    "opus": ("OGG", "OPUS", ".opus", 'audio/ogg; codecs="opus"'),
+}
+# Sampling rates the Opus encoder accepts; other sources are resampled to the next one up
+OPUS_RATES = [8000, 12000, 16000, 24000, 48000]
+
+
+def _target_rate(playback_format: str, samplerate: int) -> int:
+    if playback_format != "opus" or samplerate in OPUS_RATES:
+        return samplerate
+    return next((rate for rate in OPUS_RATES if rate >= samplerate), OPUS_RATES[-1])
+
+
+def encode_playback(src: str, dst: str, playback_format: str, block_sec: float = 60.0) -> dict:
+    """
+    Encodes the audio file `src` into a compressed playback rendition at `dst`, block by block
+    (never holding the whole signal), through a temporary file renamed into place.
+    playback_format: a key of PLAYBACK_FORMATS
+    return: metadata of the rendition for the frontend
+    """
+    format_name, subtype, _, mime = PLAYBACK_FORMATS[playback_format]
+    directory = os.path.dirname(dst) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    os.close(fd)
+    try:
+        with sf.SoundFile(src) as source:
+            channels = source.channels
+            samplerate = _target_rate(playback_format, source.samplerate)
+            resampler = None
+            if samplerate != source.samplerate:
+                import soxr
+
+                resampler = soxr.ResampleStream(source.samplerate, samplerate, channels, dtype="float32")
+            with sf.SoundFile(tmp_path, "w", samplerate, channels, subtype=subtype, format=format_name) as target:
+                blocksize = max(1, int(block_sec * source.samplerate))
+                for block in source.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+                    target.write(resampler.resample_chunk(block) if resampler is not None else block)
+                if resampler is not None:
+                    target.write(resampler.resample_chunk(np.zeros((0, channels), dtype=np.float32), last=True))
+                frames = target.frames
+        os.chmod(tmp_path, default_file_mode())
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {
+        "file": os.path.basename(dst),
+        "format": playback_format,
+        "mime": mime,
+        "sample_rate": samplerate,
+        "channels": channels,
+        "duration": frames / float(samplerate),
+        "bytes": os.path.getsize(dst),
+    }
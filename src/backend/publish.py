@@ -0,0 +1,96 @@
+import errno
+import os
+import shutil
+import tempfile
+
+from cache import atomic_write_text
+
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks
+    fcntl = None
+
+# FICLONE from linux/fs.h: share the source's extents (btrfs, XFS with reflink=1, ...)
+FICLONE = 0x40049409
+AUDIO_PUBLISH_STRATEGIES = ["auto", "reflink", "hardlink", "symlink", "copy"]
+
+
+def _reflink(src: str, dst: str) -> None:
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported on this platform")
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copystat(src, dst)
+
+
+def _hardlink(src: str, dst: str) -> None:
+    os.link(src, dst)
+
+
+def _symlink(src: str, dst: str) -> None:
+    # Relative, so the link resolves wherever the repository is mounted (backend and frontend containers differ)
+    os.symlink(os.path.relpath(os.path.abspath(src), os.path.dirname(os.path.abspath(dst))), dst)
+
+
+def _copy(src: str, dst: str) -> None:
+    shutil.copy2(src, dst)
+
+
+_PLACERS = {"reflink": _reflink, "hardlink": _hardlink, "symlink": _symlink, "copy": _copy}
+# "auto" takes the cheapest option that keeps an independent, always-resolvable file
+_AUTO_ORDER = ["reflink", "hardlink", "copy"]
+
+
+def place_file(src: str, dst: str, strategy: str = "auto", independent: bool = False) -> str:
+    """
+    Makes the file `src` available at `dst`, replacing whatever is there atomically.
+    strategy: one of AUDIO_PUBLISH_STRATEGIES; when the filesystem does not support it (e.g. a
+        hardlink across devices) the next option of reflink -> hardlink -> copy is tried
+    independent: `dst` is a retained copy, so unless a hardlink is asked for explicitly it is
+        never hardlinked (an in-place edit or truncation of either name would change both)
+    return: the strategy that was used
+    """
+    directory = os.path.dirname(dst) or "."
+    os.makedirs(directory, exist_ok=True)
+    if strategy == "auto":
+        order = _AUTO_ORDER
+    elif strategy in _AUTO_ORDER:
+        order = _AUTO_ORDER[_AUTO_ORDER.index(strategy):]
+    else:
+        order = [strategy, "copy"]
+    if independent and strategy != "hardlink":
+        order = [name for name in order if name != "hardlink"]
+
+    for name in order:
+        # Built under a temporary name in the target directory and renamed over dst
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+        os.close(fd)
+        os.remove(tmp_path)
+        try:
+            _PLACERS[name](src, tmp_path)
+            os.replace(tmp_path, dst)
+            if os.path.lexists(tmp_path):
+                # rename() is a no-op when both names are already hardlinks to the same file
+                os.remove(tmp_path)
+            return name
+        except OSError:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            if name == order[-1]:
+                raise
+
+
+def publish_text(text: str, paths: list[str]) -> None:
+    """
+    Writes the same, already serialized, text to every path atomically.
+    """
+    for path in paths:
+        atomic_write_text(path, text)
+
+
+def publish_audio(src: str, paths: list[str], strategy: str = "auto", independent: bool = False) -> list[str]:
+    """
+    Places the audio file `src` at every path (see place_file for `independent`).
+    return: the strategy used for each path
+    """
+    return [place_file(src, path, strategy, independent) for path in paths]
@@ -0,0 +1,118 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
+import os
+from tqdm import tqdm
+
+# Per-process state of a worker, set up once by _init_worker
+_worker = {}
+
+
+def _default_devices() -> list[str]:
+    import torch
+
+    if torch.cuda.is_available():
+        return [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+    return ["cpu"]
+
+
+def _init_worker(args, dataset, device_queue, num_threads: int) -> None:
+    import torch
+    from cache import StageCache
+    from metrics import RECORDER
+    from transcribe import load_offline_models
+
+    device = device_queue.get()
+    args.asr_device = args.asr_device or device
+    args.diarization_device = args.diarization_device or device
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+
+    if args.metrics_dir:
+        RECORDER.configure(args.metrics_dir, worker=f"worker{os.getpid()}")
+    _worker["args"] = args
+    _worker["dataset"] = dataset
+    _worker["models"] = load_offline_models(args)
+    _worker["stage_cache"] = StageCache(args.stage_cache) if args.stage_cache else None
+    _worker["executor"] = (
+        ThreadPoolExecutor(max_workers=2, thread_name_prefix="stage") if args.concurrent_stages else None
+    )
+    if args.verbosity > 0:
+        print(f"Worker {os.getpid()} ready on {device}")
+
+
+def _process_file(idx: int, audio_hash: str | None):
+    from metrics import RECORDER
+    from transcribe import transcribe_item
+
+    args = _worker["args"]
+    dataset = _worker["dataset"]
+    asr_model, sd_model = _worker["models"]
+    RECORDER.begin_file(dataset.audio_list[idx], audio_seconds=dataset.duration(idx))
+    try:
+        with RECORDER.stage("preprocess"):
+            item = dataset[idx]
+        RECORDER.update_file(
+            chunks=len(item["boundaries"]),
+            processed_audio_seconds=item["sample_count"] / float(dataset.sampling_rate)
+        )
+        merged, journal = transcribe_item(
+            args,
+            item,
+            asr_model,
+            sd_model,
+            dataset.sampling_rate,
+            executor=_worker["executor"],
+            stage_cache=_worker["stage_cache"],
+            audio_hash=audio_hash
+        )
+    except BaseException:
+        RECORDER.end_file("failed")
+        raise
+    RECORDER.end_file("done")
+    return item["basename"], merged, journal.path if journal is not None else None, item["peaks"]
+
+
+def run_workers(args, dataset, cache_keys: dict | None = None):
+    """
+    Transcribes every file of `dataset` in a pool of args.workers processes, each holding
+    its own ASR and diarization models on its assigned device. Files are submitted longest
+    first (LPT scheduling) to keep the makespan short. Yields (basename, merged transcript,
+    checkpoint journal path or None, waveform peaks or None, error or None) in completion
+    order, so the caller stays the only writer of the output files and the index. A failed
+    file is reported with its error while the others carry on; if the caller stops early,
+    files not started yet are cancelled.
+    """
+    cache_keys = cache_keys or {}
+    devices = args.worker_devices or _default_devices()
+    num_threads = args.worker_threads or max(1, (os.cpu_count() or 1) // args.workers)
+
+    context = multiprocessing.get_context("spawn")
+    device_queue = context.Queue()
+    for i in range(args.workers):
+        device_queue.put(devices[i % len(devices)])
+
+    durations = [dataset.duration(idx) for idx in range(len(dataset))]
+    order = sorted(range(len(dataset)), key=lambda idx: durations[idx], reverse=True)
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(args, dataset, device_queue, num_threads),
+    ) as pool:
+        futures = {}
+        for idx in order:
+            basename = dataset.audio_list[idx]
+            audio_hash = cache_keys[basename][1] if basename in cache_keys else None
+            futures[pool.submit(_process_file, idx, audio_hash)] = basename
+        try:
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Processing audio files", disable=args.verbosity == 0):
+                error = future.exception()
+                if error is not None:
+                    yield futures[future], None, None, None, error
+                else:
+                    yield (*future.result(), None)
+        except BaseException:
+            # Leaving the pool would otherwise wait for every queued file to be transcribed
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
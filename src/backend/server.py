@@ -0,0 +1,263 @@
+import argparse
+import itertools
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from index_manager import INDEX
+from models import ModelCache
+from transcribe import FilesFailedError, build_parser, transcribe
+
+
+class Job:
+    """
+    One transcription request: a directory (or a single file in it) plus CLI option overrides.
+    """
+    def __init__(self, job_id: str, args: argparse.Namespace, priority: int) -> None:
+        self.id = job_id
+        self.args = args
+        self.priority = priority
+        self.status = "queued"
+        self.processed_files = []
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "audio_dir": self.args.audio_dir,
+            "audio_files": self.args.audio_files,
+            "num_speakers": self.args.num_speakers,
+            "processed_files": self.processed_files,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def job_args(path: str, num_speakers=None, options=None) -> argparse.Namespace:
+    """
+    Builds the transcribe.py namespace for a job, so jobs accept exactly the CLI's options.
+    path: audio directory, or a single audio file inside one
+    options: {"asr_model_name": "qwen", "concurrent_stages": true, ...}
+    """
+    if os.path.isfile(path):
+        argv = ["--audio_dir", os.path.dirname(path) or ".", "--audio_files", os.path.basename(path)]
+    elif os.path.isdir(path):
+        argv = ["--audio_dir", path]
+    else:
+        raise ValueError(f"No such file or directory: {path}")
+    if num_speakers is not None:
+        argv += ["--num_speakers", str(int(num_speakers))]
+
+    for name, value in (options or {}).items():
+        if name in ("audio_dir", "audio_files", "num_speakers"):
+            raise ValueError(f"'{name}' is set from the job itself, not from options")
+        if value is None or value is False:
+            continue
+        argv.append(f"--{name}")
+        if value is True:
+            continue
+        argv += [str(v) for v in value] if isinstance(value, list) else [str(value)]
+
+    def reject(message):
+        raise ValueError(message)
+
+    parser = build_parser()
+    # argparse reports bad options by exiting; turn that into a per-job error instead
+    parser.error = reject
+    return parser.parse_args(argv)
+
+
+class JobQueue:
+    """
+    Runs submitted jobs one at a time on a single worker thread, lowest priority value first
+    (FIFO within a priority), reusing the models held in one ModelCache across jobs.
+    """
+    def __init__(self, model_cache: ModelCache) -> None:
+        self.model_cache = model_cache
+        self.jobs = {}
+        self._pending = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="transcribe-worker", daemon=True)
+        self._worker.start()
+
+    def submit(self, args: argparse.Namespace, priority: int = 0) -> Job:
+        seq = next(self._counter)
+        job = Job(f"{int(time.time())}-{seq}", args, priority)
+        with self._lock:
+            self.jobs[job.id] = job
+        self._pending.put((priority, seq, job.id))
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                return False
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            return True
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else job.to_dict()
+
+    def list(self) -> list:
+        with self._lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def queued(self) -> int:
+        with self._lock:
+            return sum(job.status == "queued" for job in self.jobs.values())
+
+    def _run(self) -> None:
+        while True:
+            _, _, job_id = self._pending.get()
+            with self._lock:
+                job = self.jobs[job_id]
+                if job.status != "queued":
+                    continue
+                job.status = "running"
+                job.started_at = time.time()
+            print(f"==============Started job {job.id} ({job.args.audio_dir})==============")
+            try:
+                processed = transcribe(job.args, model_cache=self.model_cache)
+                status, error = "done", None
+            except FilesFailedError as e:
+                # The files that did not fail were saved and are listed with the job
+                processed, status, error = e.processed, "failed", str(e)
+            except Exception as e:
+                traceback.print_exc()
+                processed, status, error = [], "failed", f"{type(e).__name__}: {e}"
+            # The frontend lists a job's files as soon as the job is reported finished
+            INDEX.flush()
+            with self._lock:
+                job.processed_files = processed
+                job.status = status
+                job.error = error
+                job.finished_at = time.time()
+            print(f"==============Finished job {job.id}: {status}==============")
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs            {"path": ..., "num_speakers": 2, "options": {...}, "priority": 0}
+    GET  /jobs            all jobs
+    GET  /jobs/<id>       one job
+    DELETE /jobs/<id>     cancel a queued job
+    GET  /health          loaded models and queue length
+    """
+    job_queue: JobQueue = None
+
+    def _send(self, status: int, body) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self):
+        parts = self.path.strip("/").split("/")
+        return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/health":
+            self._send(200, {
+                "status": "ok",
+                "queued": self.job_queue.queued(),
+                "loaded_models": self.job_queue.model_cache.loaded(),
+            })
+        elif self.path.rstrip("/") == "/jobs":
+            self._send(200, self.job_queue.list())
+        elif self._job_id() is not None:
+            job = self.job_queue.get(self._job_id())
+            if job is None:
+                self._send(404, {"error": "unknown job"})
+            else:
+                self._send(200, job)
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/jobs":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if "path" not in body:
+                raise ValueError("'path' is required")
+            args = job_args(body["path"], body.get("num_speakers"), body.get("options"))
+            priority = int(body.get("priority", 0))
+        except (ValueError, TypeError, AttributeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        job = self.job_queue.submit(args, priority)
+        self._send(202, job.to_dict())
+
+    def do_DELETE(self) -> None:
+        job_id = self._job_id()
+        if job_id is None or self.job_queue.get(job_id) is None:
+            self._send(404, {"error": "unknown job"})
+        elif self.job_queue.cancel(job_id):
+            self._send(200, self.job_queue.get(job_id))
+        else:
+            self._send(409, {"error": "only queued jobs can be cancelled"})
+
+    def address_string(self) -> str:
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main(args):
+    model_cache = ModelCache()
+    if args.preload:
+        # Load the default models (plus any overrides) before accepting jobs
+        defaults = job_args(".", options=json.loads(args.preload_options))
+        from transcribe import load_offline_models
+        load_offline_models(defaults, model_cache)
+
+    RequestHandler.job_queue = JobQueue(model_cache)
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ThreadingUnixHTTPServer(args.socket, RequestHandler)
+        print(f"Transcription server listening on unix:{args.socket}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+        print(f"Transcription server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8005, help="Port to listen on")
+    parser.add_argument("--socket", type=str, default=None, help="Listen on this Unix socket path instead of TCP")
+    parser.add_argument("--preload", action="store_true", help="Load the offline ASR and diarization models at startup instead of on the first job")
+    parser.add_argument("--preload_options", type=str, default="{}", help="JSON object of transcribe.py options used for --preload (e.g. '{\"asr_model_name\": \"qwen\"}')")
+    args = parser.parse_args()
+    main(args)
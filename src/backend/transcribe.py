@@ -1,15 +1,39 @@
-from models import get_sd_model, get_asr_model, get_online_llm_model
-from utils import diarize_text, save_transcripts_json, save_index_json
-from data import AudioInput
+# ruff: noqa: E402 -- START_TIME has to be taken before the heavy imports below
+import time
+# Measured before anything else is imported, so startup regressions show up in the logs
+START_TIME = time.perf_counter()
+
+from models import get_sd_model, get_asr_model, get_online_llm_model, ModelCache
+from models.base import group_by_length
+from index_manager import INDEX
+from utils import diarize_text, outputs_current, save_partial_transcript_json, save_peaks_json, save_playback_audio, save_transcripts_json, save_index_json
+from data import AudioInput, iterate_audio
+from cache import ResultCache, StageCache, file_sha256, result_config, asr_config, diarization_config
+from checkpoint import ChunkJournal
+from work_queue import FileWorkQueue
+from manifest import load_manifest, entry_args, group_jobs
+from metrics import RECORDER, log
+from publish import AUDIO_PUBLISH_STRATEGIES
+from peaks import file_peaks
+from playback import PLAYBACK_FORMATS
 
 import os
 import argparse
-from tqdm import tqdm
-import torch
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import sys
 import numpy as np
-import tempfile
-import soundfile as sf
-from pyannote.core import Segment
+
+
+class FilesFailedError(RuntimeError):
+    """
+    Raised at the end of a run in which some files failed; every other file was saved.
+    failed: {file name: "ErrorType: message"}
+    """
+    def __init__(self, failed: dict, processed: list) -> None:
+        super().__init__(f"{len(failed)} file(s) failed: {', '.join(failed)}")
+        self.failed = failed
+        self.processed = processed
 
 
 def _to_mono(segment: np.ndarray) -> np.ndarray:
@@ -18,124 +42,636 @@ def _to_mono(segment: np.ndarray) -> np.ndarray:
     return np.mean(segment, axis=1, dtype=np.float32)
 
 
-def _run_asr_on_segment(asr_model, args, segment: np.ndarray, sampling_rate: int):
-    if args.asr_model_name == "openai":
-        return asr_model.run(_to_mono(segment))
-    if args.asr_model_name == "kotoba":
-        return asr_model.run(_to_mono(segment))
+def _asr_input(args, segment: np.ndarray, sampling_rate: int):
     if args.asr_model_name == "qwen":
-        return asr_model.run((_to_mono(segment), sampling_rate))
-    return asr_model.run(_to_mono(segment))
+        return (_to_mono(segment), sampling_rate)
+    return _to_mono(segment)
 
 
-def _run_asr_on_segments(asr_model, args, segments: list[np.ndarray], sampling_rate: int):
-    merged = []
+def _run_asr_on_segments(asr_model, args, segments: list[np.ndarray], sampling_rate: int, stage_cache=None, journal=None):
+    inputs = [_asr_input(args, segment, sampling_rate) for segment in segments]
+    offsets = []
     offset = 0.0
     for segment in segments:
-        chunk_output = _run_asr_on_segment(asr_model, args, segment, sampling_rate)
+        offsets.append(offset)
+        offset += len(segment) / float(sampling_rate)
+
+    chunk_outputs = [None] * len(inputs)
+    if journal is not None:
+        for i, output in journal.asr.items():
+            if i < len(chunk_outputs):
+                chunk_outputs[i] = output
+    keys = [None] * len(inputs)
+    if stage_cache is not None:
+        config = asr_config(args)
+        for i, segment in enumerate(segments):
+            keys[i] = stage_cache.asr_key(_to_mono(segment), config)
+            if chunk_outputs[i] is None:
+                chunk_outputs[i] = stage_cache.get_asr(keys[i])
+    missing = [i for i, output in enumerate(chunk_outputs) if output is None]
+
+    batch_size = getattr(args, "asr_batch_size", 1)
+    if batch_size > 1:
+        groups = [[missing[g] for g in group] for group in group_by_length([len(segments[i]) for i in missing], batch_size)]
+    else:
+        groups = [[i] for i in missing]
+    for indices in groups:
+        if batch_size > 1:
+            batch_seconds = sum(len(segments[i]) for i in indices) / float(sampling_rate)
+            with RECORDER.model_call(type(asr_model).__name__, batch_seconds):
+                outputs = asr_model.run_batch([inputs[i] for i in indices], batch_size=batch_size)
+        else:
+            outputs = [asr_model.run(inputs[indices[0]])]
+        # Persist each chunk as soon as its batch finishes
+        for i, output in zip(indices, outputs):
+            chunk_outputs[i] = output
+            if stage_cache is not None:
+                stage_cache.put_asr(keys[i], output)
+            if journal is not None:
+                journal.record_asr(i, offsets[i], output)
+
+    from pyannote.core import Segment
+
+    merged = []
+    for chunk_offset, chunk_output in zip(offsets, chunk_outputs):
         for seg, text in chunk_output:
-            shifted = Segment(seg.start + offset, seg.end + offset)
+            shifted = Segment(seg.start + chunk_offset, seg.end + chunk_offset)
             merged.append((shifted, text))
-        offset += len(segment) / float(sampling_rate)
     merged.sort(key=lambda x: (x[0].start, x[0].end))
     return merged
 
 
-def transcribe(args):
-    dataset = AudioInput(args.audio_dir, target_files=args.audio_files)
+def _with_torch_threads(num_threads: int, fn, *fn_args, **fn_kwargs):
+    # With OpenMP, torch.set_num_threads only affects the calling thread, so each
+    # stage can get its own intra-op thread budget when the stages run concurrently.
+    if num_threads and num_threads > 0:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    return fn(*fn_args, **fn_kwargs)
+
+
+def _timed_stage(stage: str, fn):
+    def run():
+        with RECORDER.stage(stage):
+            return fn()
+    return run
+
+
+def _run_diarization(sd_model, args, waveform: np.ndarray, sampling_rate: int, stage_cache=None, journal=None):
+    if journal is not None and journal.diarization is not None:
+        return journal.diarization
+    ann = None
+    if stage_cache is not None:
+        key = stage_cache.diarization_key(waveform, sampling_rate, diarization_config(args))
+        ann = stage_cache.get_diarization(key)
+    if ann is None:
+        ann = sd_model.run((waveform, sampling_rate))
+        if stage_cache is not None:
+            stage_cache.put_diarization(key, ann)
+    if journal is not None:
+        journal.record_diarization(ann)
+    return ann
+
+
+def _run_offline_stages(args, asr_model, sd_model, waveform_segments: list[np.ndarray], sampling_rate: int, executor=None, stage_cache=None, journal=None):
+    concatenated_waveform = np.concatenate(waveform_segments, axis=0)
+
+    run_asr = _timed_stage("asr", partial(
+        _with_torch_threads, args.asr_threads,
+        _run_asr_on_segments, asr_model, args, waveform_segments, sampling_rate, stage_cache, journal
+    ))
+    # Run diarization on the same preprocessed (concatenated) audio timeline
+    run_diarization = _timed_stage("diarization", partial(
+        _with_torch_threads, args.diarization_threads,
+        _run_diarization, sd_model, args, concatenated_waveform, sampling_rate, stage_cache, journal
+    ))
+
+    if executor is None:
+        return run_asr(), run_diarization()
+
+    # ASR and diarization are independent until diarize_text, so run them side by side
+    diar_future = executor.submit(run_diarization)
+    asr_future = executor.submit(run_asr)
+    return asr_future.result(), diar_future.result()
+
+
+def load_offline_models(args, model_cache=None):
+    import torch
+
+    # ASR and Diarization models
+    if model_cache is not None:
+        asr_model = model_cache.get_asr_model(args)
+        sd_model = model_cache.get_sd_model(args)
+    else:
+        asr_model = get_asr_model(args)
+        sd_model = get_sd_model(args)
+    sd_model.setup_model_if_needed()
+
+    # Move diarization model to the configured device (GPU if available by default)
+    device = torch.device(sd_model.get_device("diarization_device"))
+    sd_model.model.to(device)
+    return asr_model, sd_model
+
+
+def transcribe_item(args, item: dict, asr_model, sd_model, sampling_rate: int, executor=None, stage_cache=None, audio_hash=None):
+    """
+    Runs the offline pipeline (ASR + diarization + merge) on one preprocessed AudioInput item.
+    return: (merged transcript, checkpoint journal or None); the caller discards the journal once saved
+    """
+    basename = item["basename"]
+    journal = None
+    if args.checkpoint_dir:
+        if audio_hash is None:
+            audio_hash = file_sha256(os.path.join(args.audio_dir, basename))
+        journal = ChunkJournal(
+            args.checkpoint_dir,
+            audio_hash,
+            result_config(args, sampling_rate),
+            item["boundaries"]
+        )
+        if journal.asr or journal.diarization is not None:
+            log(args, f"Resuming {basename} from checkpoint ({len(journal.asr)}/{len(item['boundaries'])} chunks done)")
+
+    # Run ASR on split waveforms (timestamps merged by offset) and diarization
+    asr_output, diar_output = _run_offline_stages(
+        args=args,
+        asr_model=asr_model,
+        sd_model=sd_model,
+        waveform_segments=item["waveform"],
+        sampling_rate=sampling_rate,
+        executor=executor,
+        stage_cache=stage_cache,
+        journal=journal
+    )
+
+    # Merge ASR + speaker info
+    with RECORDER.stage("merge"):
+        merged = diarize_text(args, asr_output, diar_output)
+    return merged, journal
+
+
+def _save_result(args, basename: str, merged, result_cache=None, cache_entry=None, peaks=None):
+    with RECORDER.stage("save"):
+        _write_result(args, basename, merged, result_cache, cache_entry, peaks)
+    log(args, f"==============Saved transcripts for {basename}==============")
+
+
+def _write_result(args, basename: str, merged, result_cache=None, cache_entry=None, peaks=None, reuse_current=False):
+    """
+    reuse_current: keep the transcripts, audio and peaks already on disk when they are current
+        (cache hits, which are materialized again on every run)
+    """
+    if result_cache is not None and cache_entry is not None:
+        key, audio_hash, config = cache_entry
+        result_cache.put(key, merged, audio_hash, config)
+
+    # Save JSON and TXT for this file
+    basename_no_ext = os.path.splitext(basename)[0]
+    if not (reuse_current and outputs_current(args, merged, basename_no_ext)):
+        save_transcripts_json(args, merged, basename_no_ext)
+        if args.peaks_per_sec:
+            # Files that were never decoded here (online LLM, cache hits) are summarized from disk
+            if peaks is None:
+                peaks = file_peaks(os.path.join(args.audio_dir, basename), args.peaks_per_sec)
+            save_peaks_json(peaks, basename_no_ext)
+    if args.playback_format != "none":
+        save_playback_audio(args, basename_no_ext)
+    # Update index.json immediately
+    save_index_json(basename)
+
+
+def transcribe(args, model_cache=None):
+    # Every call, so a job without --metrics_dir in a long-lived server does not write to the previous job's
+    RECORDER.configure(args.metrics_dir)
+    dataset = AudioInput(
+        args.audio_dir,
+        target_files=args.audio_files,
+        # With a result cache, already-seen audio is recognized by content instead of by name
+        skip_processed=not args.result_cache_dir,
+        num_speakers=args.num_speakers,
+        streaming=args.streaming_audio,
+        stream_block_sec=args.stream_block_sec,
+        peaks_per_sec=args.peaks_per_sec or None
+    )
     args.num_speakers = dataset.num_speakers
 
     if args.audio_files is None and dataset.skipped_files:
-        print(
+        log(
+            args,
             f"Skipping {len(dataset.skipped_files)} already processed file(s): "
             + ", ".join(dataset.skipped_files)
         )
+
+    processed_files = []
+    result_cache = None
+    cache_keys = {}
+    if args.result_cache_dir:
+        result_cache = ResultCache(
+            args.result_cache_dir,
+            max_entries=args.result_cache_max_entries,
+            max_bytes=int(args.result_cache_max_gb * 1024 ** 3) if args.result_cache_max_gb else None
+        )
+        config = result_config(args, dataset.sampling_rate)
+        pending = []
+        for basename in dataset.audio_list:
+            audio_hash = file_sha256(os.path.join(args.audio_dir, basename))
+            key = result_cache.key(audio_hash, config)
+            cached = result_cache.get(key)
+            if cached is None:
+                cache_keys[basename] = (key, audio_hash, config)
+                pending.append(basename)
+                continue
+            # Cache hit: materialize the outputs without running any model
+            _write_result(args, basename, cached, reuse_current=True)
+            processed_files.append(basename)
+            log(args, f"==============Reused cached transcripts for {basename}==============")
+        dataset.audio_list = pending
+
     if len(dataset) == 0:
-        print("No audio files to process.")
-        return []
+        log(args, "No audio files to process.")
+        return processed_files
 
     use_online_llm = bool(args.online_llm)
 
+    work_queue = None
+    if args.queue:
+        if args.workers > 1:
+            raise ValueError("--queue cannot be combined with --workers; start one instance per device instead.")
+        work_queue = FileWorkQueue(
+            args.queue_dir or os.path.join(args.audio_dir, ".queue"),
+            lease_ttl=args.lease_ttl,
+            heartbeat_sec=args.lease_heartbeat
+        )
+
+    if not use_online_llm and args.workers > 1:
+        from scheduler import run_workers
+
+        # Model-holding worker processes; results come back to this process for saving
+        failed = {}
+        for basename, merged, journal_path, peaks, error in run_workers(args, dataset, cache_keys):
+            if error is not None:
+                # The file's checkpoint journal (if any) is kept, so a rerun resumes it
+                failed[basename] = f"{type(error).__name__}: {error}"
+                log(args, f"==============Failed {basename}: {failed[basename]}==============")
+                continue
+            _save_result(args, basename, merged, result_cache, cache_keys.get(basename), peaks)
+            if journal_path is not None and os.path.exists(journal_path):
+                os.remove(journal_path)
+            processed_files.append(basename)
+        if failed:
+            raise FilesFailedError(failed, processed_files)
+        return processed_files
+
+    from tqdm import tqdm
+
+    load_start = time.perf_counter()
     if use_online_llm:
-        online_llm_model = get_online_llm_model(args)
+        online_llm_model = (
+            model_cache.get_online_llm_model(args) if model_cache is not None else get_online_llm_model(args)
+        )
     else:
-        # ASR and Diarization models
-        asr_model = get_asr_model(args)
-        sd_model = get_sd_model(args)
-        sd_model.setup_model_if_needed()
+        asr_model, sd_model = load_offline_models(args, model_cache)
+    if use_online_llm and args.online_upload_cleanup:
+        online_llm_model.cleanup_uploads(unused_sec=args.online_upload_keep_hours * 3600)
+    log(args, f"Models ready in {time.perf_counter() - load_start:.2f}s ({time.perf_counter() - START_TIME:.2f}s since start)")
 
-        # Move diarization model to GPU if available
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        sd_model.model.to(device)
+    stage_cache = StageCache(args.stage_cache) if args.stage_cache and not use_online_llm else None
+    executor = (
+        ThreadPoolExecutor(max_workers=2, thread_name_prefix="stage")
+        if args.concurrent_stages and not use_online_llm
+        else None
+    )
+
+    # In queue mode, a file is only loaded once this instance holds its lease
+    claim = work_queue.claim if work_queue is not None else None
+    if use_online_llm and args.online_llm_concurrency > 1:
+        try:
+            processed_files += _transcribe_online_concurrently(
+                args, online_llm_model, dataset, claim, work_queue, result_cache, cache_keys
+            )
+        except FilesFailedError as e:
+            # Cache hits reused above count as processed too
+            raise FilesFailedError(e.failed, processed_files + e.processed) from None
+        finally:
+            if work_queue is not None:
+                work_queue.close()
+        return processed_files
 
-    processed_files = []
     data_iter = (
-        ({"basename": basename} for basename in dataset.audio_list)
+        (
+            {"index": idx, "basename": basename}
+            for idx, basename in enumerate(dataset.audio_list)
+            if claim is None or claim(basename)
+        )
         if use_online_llm
-        else dataset
+        else iterate_audio(dataset, prefetch_depth=args.prefetch_depth, num_workers=args.loader_workers, claim=claim)
     )
     # Process and save each file sequentially
-    for item in tqdm(data_iter, total=len(dataset), desc="Processing audio files"):
-        basename = item["basename"]
-        audio_path = os.path.join(args.audio_dir, basename)
-        if use_online_llm:
-            # OnlineLLM output already includes timestamp + speaker attribution.
-            merged = online_llm_model.run(audio_path)
-        else:
-            waveform_segments = item["waveform"]
-            concatenated_waveform = np.concatenate(waveform_segments, axis=0)
-
-            # Run ASR on split waveforms and merge timestamps by offset
-            asr_output = _run_asr_on_segments(
-                asr_model=asr_model,
-                args=args,
-                segments=waveform_segments,
-                sampling_rate=dataset.sampling_rate
+    try:
+        wait_start = time.perf_counter()
+        for item in tqdm(data_iter, total=len(dataset), desc="Processing audio files", disable=args.verbosity == 0):
+            basename = item["basename"]
+            # Time spent blocked on decoding/preprocessing (or on claiming a lease) for this file
+            RECORDER.begin_file(
+                basename,
+                audio_seconds=dataset.duration(item["index"]),
+                input_wait_seconds=time.perf_counter() - wait_start
             )
-
-            # Run diarization on the same preprocessed (concatenated) audio timeline
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_audio:
-                tmp_audio_path = tmp_audio.name
+            if "boundaries" in item:
+                RECORDER.update_file(
+                    chunks=len(item["boundaries"]),
+                    processed_audio_seconds=item["sample_count"] / float(dataset.sampling_rate)
+                )
+            journal = None
             try:
-                sf.write(tmp_audio_path, concatenated_waveform, dataset.sampling_rate)
-                diar_output = sd_model.run(tmp_audio_path)
-            finally:
-                if os.path.exists(tmp_audio_path):
-                    os.remove(tmp_audio_path)
+                if use_online_llm:
+                    # OnlineLLM output already includes timestamp + speaker attribution.
+                    with RECORDER.stage("online_llm"):
+                        merged = _run_online(args, online_llm_model, dataset, item["index"])
+                else:
+                    merged, journal = transcribe_item(
+                        args,
+                        item,
+                        asr_model,
+                        sd_model,
+                        dataset.sampling_rate,
+                        executor=executor,
+                        stage_cache=stage_cache,
+                        audio_hash=cache_keys[basename][1] if basename in cache_keys else None
+                    )
+
+                _save_result(args, basename, merged, result_cache, cache_keys.get(basename), item.get("peaks"))
+            except BaseException:
+                RECORDER.end_file("failed")
+                if work_queue is not None:
+                    work_queue.release(basename)
+                raise
+            RECORDER.end_file("done")
+            if work_queue is not None:
+                work_queue.complete(basename)
+            if journal is not None:
+                journal.discard()
+            processed_files.append(basename)
+            wait_start = time.perf_counter()
+    finally:
+        # Stop prefetching first, so no file is claimed after the queue releases its leases
+        data_iter.close()
+        if work_queue is not None:
+            work_queue.close()
+        if executor is not None:
+            executor.shutdown()
+        if stage_cache is not None:
+            stage_cache.close()
+    return processed_files
 
-            # Merge ASR + speaker info
-            merged = diarize_text(args, asr_output, diar_output)
 
-        # Save JSON and TXT for this file
-        basename_no_ext = os.path.splitext(basename)[0]
-        save_transcripts_json(args, merged, basename_no_ext)
-        # Update index.json immediately
-        save_index_json(basename)
+def _run_online(args, online_llm_model, dataset, idx: int):
+    """
+    One file through the online LLM: whole, or with --online_chunk_sec as silence-cut pieces
+    sent in parallel and stitched back onto the file's timeline.
+    """
+    basename = dataset.audio_list[idx]
+    path = os.path.join(args.audio_dir, basename)
+    if not args.online_chunk_sec:
+        if args.online_llm_stream and args.online_llm_stream_flush:
+            name = os.path.splitext(basename)[0]
+            return online_llm_model.run_streaming(
+                path, lambda segments: save_partial_transcript_json(segments, name)
+            )
+        return online_llm_model.run(path)
+    import tempfile
+
+    with tempfile.TemporaryDirectory(prefix="online-chunks-") as tmp_dir:
+        pieces = dataset.split_for_upload(
+            idx,
+            tmp_dir,
+            chunk_sec=args.online_chunk_sec,
+            overlap_sec=args.online_chunk_overlap_sec
+        )
+        if len(pieces) > 1:
+            log(args, f"Sending {basename} as {len(pieces)} pieces")
+        return online_llm_model.run_chunks(pieces, args.online_chunk_overlap_sec)
+
 
+def _run_online_path(args, online_llm_model, dataset, positions: dict, path: str):
+    return _run_online(args, online_llm_model, dataset, positions[os.path.basename(path)])
+
+
+def _transcribe_online_concurrently(args, online_llm_model, dataset, claim=None, work_queue=None, result_cache=None, cache_keys=None):
+    """
+    Online mode with several Gemini requests in flight; each transcript is saved as soon as it
+    arrives. A file that still fails after its retries does not abort the remaining files; the
+    failures are raised together as FilesFailedError once every other file is saved.
+    return: list of processed file names
+    """
+    from tqdm import tqdm
+
+    paths = (
+        os.path.join(args.audio_dir, basename)
+        for basename in dataset.audio_list
+        if claim is None or claim(basename)
+    )
+    # Position of each file in the dataset, looked up per result instead of searching the list
+    positions = {basename: idx for idx, basename in enumerate(dataset.audio_list)}
+    processed_files = []
+    failed = {}
+    progress = tqdm(total=len(dataset), desc="Processing audio files", disable=args.verbosity == 0)
+    run = partial(_run_online_path, args, online_llm_model, dataset, positions)
+    for path, merged, error, wall_seconds in online_llm_model.run_many(paths, run):
+        basename = os.path.basename(path)
+        audio_seconds = dataset.duration(positions[basename])
+        progress.update(1)
+        if error is not None:
+            RECORDER.record_file(basename, "failed", wall_seconds, audio_seconds=audio_seconds, error=repr(error))
+            if work_queue is not None:
+                work_queue.release(basename)
+            failed[basename] = f"{type(error).__name__}: {error}"
+            log(args, f"==============Failed {basename}: {failed[basename]}==============")
+            continue
+        _save_result(args, basename, merged, result_cache, (cache_keys or {}).get(basename))
+        RECORDER.record_file(basename, "done", wall_seconds, audio_seconds=audio_seconds)
+        if work_queue is not None:
+            work_queue.complete(basename)
         processed_files.append(basename)
-        print(f"==============Saved transcripts for {basename}==============")
+    progress.close()
+    if failed:
+        raise FilesFailedError(failed, processed_files)
+    return processed_files
 
+
+def run_manifest(args, model_cache=None):
+    """
+    Transcribes every entry of args.manifest in this process.
+    Entries are grouped by model configuration so each model is loaded once and never swapped back in.
+    return: list of processed file names
+    """
+    parser = build_parser()
+    jobs = [
+        entry_args(args, entry, lambda argv, namespace: parser.parse_args(argv, namespace=namespace))
+        for entry in load_manifest(args.manifest)
+    ]
+    groups = group_jobs(jobs)
+    model_cache = model_cache or ModelCache()
+
+    processed_files = []
+    failed = {}
+    for group_no, runs in enumerate(groups, start=1):
+        if group_no > 1:
+            # Free the previous configuration's models before the next one loads
+            model_cache.clear()
+        log(
+            args,
+            f"==============Manifest group {group_no}/{len(groups)}: "
+            f"{runs[0].asr_model_name if not runs[0].online_llm else runs[0].online_llm_model}, "
+            f"{len(runs)} run(s)=============="
+        )
+        for run_args in runs:
+            try:
+                processed_files += transcribe(run_args, model_cache=model_cache)
+            except FilesFailedError as e:
+                # The remaining entries still run; the failures are reported together at the end
+                processed_files += e.processed
+                failed.update(e.failed)
+    if failed:
+        raise FilesFailedError(failed, processed_files)
     return processed_files
 
 
+def list_pending(args):
+    """
+    Dry run: prints what a real run would process, without importing any ML library.
+    return: list of (audio_dir, file name) still to be transcribed
+    """
+    if args.manifest:
+        parser = build_parser()
+        jobs = [
+            entry_args(args, entry, lambda argv, namespace: parser.parse_args(argv, namespace=namespace))
+            for entry in load_manifest(args.manifest)
+        ]
+        runs = [run_args for runs in group_jobs(jobs) for run_args in runs]
+    else:
+        runs = [args]
+
+    pending = []
+    total_sec = 0.0
+    for run_args in runs:
+        dataset = AudioInput(
+            run_args.audio_dir,
+            target_files=run_args.audio_files,
+            skip_processed=not run_args.result_cache_dir,
+            num_speakers=run_args.num_speakers
+        )
+        result_cache = (
+            ResultCache(run_args.result_cache_dir)
+            if run_args.result_cache_dir and os.path.isdir(run_args.result_cache_dir)
+            else None
+        )
+        queue_dir = run_args.queue_dir or os.path.join(run_args.audio_dir, ".queue")
+        model = run_args.online_llm_model if run_args.online_llm else f"{run_args.asr_model_name}+{run_args.diarization_model_name}"
+        print(f"{run_args.audio_dir} (num_speakers={dataset.num_speakers}, {model})")
+        for fname in dataset.skipped_files:
+            print(f"  processed  {fname}")
+        for idx, fname in enumerate(dataset.audio_list):
+            duration = dataset.duration(idx)
+            if run_args.queue and os.path.exists(FileWorkQueue.done_marker(queue_dir, fname)):
+                status = "done"
+            elif result_cache is not None and result_cache.contains(
+                result_cache.key(file_sha256(os.path.join(run_args.audio_dir, fname)), result_config(run_args, dataset.sampling_rate))
+            ):
+                status = "cached"
+            else:
+                status = "pending"
+                pending.append((run_args.audio_dir, fname))
+                total_sec += duration
+            print(f"  {status:<9}  {fname}  ({duration:.1f}s)")
+
+    heavy = [name for name in ("torch", "librosa", "transformers", "whisper", "pyannote.audio") if name in sys.modules]
+    print(
+        f"{len(pending)} file(s) pending, {total_sec / 60:.1f} min of audio. "
+        f"Listed in {time.perf_counter() - START_TIME:.2f}s; ML libraries imported: {', '.join(heavy) or 'none'}"
+    )
+    return pending
+
+
 def main(args):
-    processed = transcribe(args)
-    print(f"Finished processing {len(processed)} files.")
+    if args.list:
+        list_pending(args)
+        return
+    log(args, f"Startup (imports) took {time.perf_counter() - START_TIME:.2f}s")
+    try:
+        processed = run_manifest(args) if args.manifest else transcribe(args)
+    except FilesFailedError as e:
+        INDEX.flush()
+        # Printed at any verbosity: wrappers and users must see which files are missing
+        print(f"Finished processing {len(e.processed)} files; {len(e.failed)} failed:", file=sys.stderr)
+        for basename, error in e.failed.items():
+            print(f"  {basename}: {error}", file=sys.stderr)
+        sys.exit(1)
+    INDEX.flush()
+    log(args, f"Finished processing {len(processed)} files.")
 
 
-if __name__ == '__main__':
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
-    parser.add_argument("--audio_dir", type=str, required=True, help="Directory containing audio files")
+    parser.add_argument("--audio_dir", type=str, default=None, help="Directory containing audio files")
+    parser.add_argument("--manifest", type=str, default=None, help="JSONL/CSV manifest of paths (files or directories) with optional num_speakers, language and model overrides, processed in one run instead of --audio_dir")
+    parser.add_argument("--list", action="store_true", help="Dry run: list the files that would be transcribed (with durations and cache/queue status) without loading any model")
     parser.add_argument("--audio_files", type=str, nargs="+", default=None, help="Optional file name(s) to process from --audio_dir (e.g. sample1.wav sample2.wav)")
+    parser.add_argument("--audio_publish", type=str, choices=AUDIO_PUBLISH_STRATEGIES, default="auto", help="How the audio is placed in the frontend and output directories: auto (reflink, else hardlink for the frontend and a full copy for outputs/), reflink, hardlink, symlink (relative) or copy")
+    parser.add_argument("--peaks_per_sec", type=float, default=20.0, help="Resolution of the waveform peak pyramid written for the frontend (finest level, min/max pairs per second; 0 = no peak files)")
+    parser.add_argument("--playback_format", type=str, choices=["none", *PLAYBACK_FORMATS], default="none", help="Also encode a compressed playback rendition (lossless flac, or opus at ~30 kbps) that the frontend streams instead of the WAV")
     parser.add_argument("--online_llm", action="store_true", help="Whether to use an online LLM for ASR + diarization instead of separate models")
     parser.add_argument("--online_llm_model", type=str, choices=["gemini"], default="gemini", help="Online LLM model to use for ASR & diarization")
+    parser.add_argument("--online_llm_concurrency", type=int, default=1, help="Number of online LLM requests in flight at once; transcripts are saved as they complete")
+    parser.add_argument("--online_llm_rps", type=float, default=0.0, help="Rate limit for online LLM API calls (uploads + generations) per second (0 = unlimited)")
+    parser.add_argument("--online_llm_retries", type=int, default=5, help="Retries with exponential backoff for timeouts, 429 and 5xx responses of the online LLM API")
+    parser.add_argument("--online_llm_stream", action="store_true", help="Stream online LLM responses and parse them as they arrive")
+    parser.add_argument("--online_llm_stream_flush", action="store_true", help="With --online_llm_stream, write finalized segments to the frontend transcript JSON while the response is still coming in (whole files only, not --online_chunk_sec pieces)")
+    parser.add_argument("--online_chunk_sec", type=float, default=0.0, help="Split recordings longer than this many seconds at silences and send the pieces to the online LLM in parallel (0 = send whole files)")
+    parser.add_argument("--online_chunk_overlap_sec", type=float, default=30.0, help="Audio shared by consecutive pieces, used to match speaker labels across them")
+    parser.add_argument("--online_upload_cache", type=str, default=None, help="JSON file remembering uploaded audio by content hash, so unexpired uploads are reused instead of sent again")
+    parser.add_argument("--online_upload_cleanup", action="store_true", help="Before transcribing, forget expired uploads and delete remote files unused for --online_upload_keep_hours")
+    parser.add_argument("--online_upload_keep_hours", type=float, default=24.0, help="Remote uploads unused for this long are deleted by --online_upload_cleanup")
     parser.add_argument("--openai_language", type=str, default="ja", help="Language of audio files for OpenAI Whisper (e.g. 'en'(English), 'ja'(Janpanese))")
     parser.add_argument("--qwen_language", type=str, choices=['Chinese', 'English', 'Cantonese', 'Arabic', 'German', 'French', 'Spanish', 
                                                             'Portuguese', 'Indonesian', 'Italian', 'Korean', 'Russian', 'Thai', 'Vietnamese', 
                                                             'Japanese', 'Turkish', 'Hindi', 'Malay', 'Dutch', 'Swedish', 'Danish', 'Finnish', 
                                                             'Polish', 'Czech', 'Filipino', 'Persian', 'Greek', 'Romanian', 'Hungarian', 'Macedonian'], 
                         default="Japanese", help="Language of audio files for Qwen ASR")
+    parser.add_argument("--num_speakers", type=int, default=None, help="Number of speakers; defaults to the N in an audios/num_speakers_N directory name")
     parser.add_argument("--diarization_model_name", type=str, choices=["community", "precision"], default="community", help="Diarization model to use")
     parser.add_argument("--asr_model_name", type=str, choices=["kotoba", "openai", "qwen"], default="openai", help="ASR model to use")
+    parser.add_argument("--asr_batch_size", type=int, default=8, help="Number of silence-split chunks decoded together per ASR batch (1 = one chunk at a time)")
+    parser.add_argument("--prefetch_depth", type=int, default=1, help="Number of files decoded/resampled/split ahead of the one in inference (0 = no prefetch)")
+    parser.add_argument("--loader_workers", type=int, default=0, help="Preprocess files in this many worker processes instead of a background thread")
+    parser.add_argument("--concurrent_stages", action="store_true", help="Run ASR and diarization of each file at the same time instead of one after the other")
+    parser.add_argument("--asr_device", type=str, default=None, help="Device for the ASR model (e.g. 'cuda:0', 'cpu'); defaults to the first GPU if available")
+    parser.add_argument("--diarization_device", type=str, default=None, help="Device for the diarization model (e.g. 'cuda:1', 'cpu'); defaults to the first GPU if available")
+    parser.add_argument("--asr_threads", type=int, default=0, help="torch intra-op CPU threads for the ASR stage (0 = torch default)")
+    parser.add_argument("--diarization_threads", type=int, default=0, help="torch intra-op CPU threads for the diarization stage (0 = torch default)")
+    parser.add_argument("--streaming_audio", action="store_true", help="Decode, resample and silence-split audio block by block instead of loading whole files (for multi-hour recordings)")
+    parser.add_argument("--stream_block_sec", type=float, default=60.0, help="Block length in seconds read at a time with --streaming_audio")
+    parser.add_argument("--result_cache_dir", type=str, default=None, help="Directory of a transcript cache keyed on audio content and model configuration; cached files skip inference")
+    parser.add_argument("--result_cache_max_entries", type=int, default=None, help="Evict least recently used cache entries beyond this count")
+    parser.add_argument("--result_cache_max_gb", type=float, default=None, help="Evict least recently used cache entries beyond this total size")
+    parser.add_argument("--stage_cache", type=str, default=None, help="SQLite file caching per-chunk ASR output and diarization results, so each stage is only rerun when its own inputs change")
+    parser.add_argument("--checkpoint_dir", type=str, default=None, help="Directory for per-file checkpoint journals; an interrupted file resumes from its first unfinished chunk")
+    parser.add_argument("--workers", type=int, default=1, help="Number of model-holding worker processes; files are scheduled longest first")
+    parser.add_argument("--worker_devices", type=str, nargs="+", default=None, help="Devices assigned round-robin to workers (e.g. cuda:0 cuda:1 cpu); defaults to all visible GPUs, else cpu")
+    parser.add_argument("--worker_threads", type=int, default=0, help="torch intra-op CPU threads per worker (0 = split the CPU cores evenly across workers)")
+    parser.add_argument("--queue", action="store_true", help="Cooperatively drain --audio_dir with other instances through lease files on the shared filesystem")
+    parser.add_argument("--queue_dir", type=str, default=None, help="Directory holding the queue's lease and done files (default: <audio_dir>/.queue)")
+    parser.add_argument("--lease_ttl", type=float, default=300.0, help="Seconds without a heartbeat after which another instance may take over a file")
+    parser.add_argument("--verbosity", type=int, choices=[0, 1, 2], default=1, help="0 = silent, 1 = progress banners, 2 = also print every model output (segment lists, diarization)")
+    parser.add_argument("--metrics_dir", type=str, default=None, help="Write per-file timing/memory records (files/<name>.json) and a Prometheus textfile to this directory")
+    parser.add_argument("--lease_heartbeat", type=float, default=30.0, help="Seconds between lease heartbeats")
+    return parser
+
+
+if __name__ == '__main__':
+    parser = build_parser()
     args = parser.parse_args()
+    if not args.audio_dir and not args.manifest:
+        parser.error("one of --audio_dir or --manifest is required")
     main(args)
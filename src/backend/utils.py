@@ -1,23 +1,101 @@
 from pyannote.core import Segment, Annotation, Timeline
-from collections import defaultdict
+import numpy as np
 import json
 import os
-import shutil
+
+from cache import atomic_write_text
+from index_manager import INDEX
+from peaks import peaks_current
+from playback import PLAYBACK_FORMATS, encode_playback
+from publish import publish_audio, publish_text
 
 PUNC_SENT_END = ['.', '?', '!', '、', '。']
 
+# pyannote's segment precision: crop() drops intersections shorter than this (in seconds).
+# Overlaps computed from cumulative sums carry rounding error, so speakers within this of
+# the best one are resolved with crop() instead of being compared directly.
+MIN_OVERLAP = 1e-6
+
+def speaker_turn_arrays(ann):
+    """
+    Flattens a diarization Annotation into per-speaker NumPy arrays.
+    Returns (labels, turns) where turns[k] = (sorted starts, cumsum of starts,
+    sorted ends, cumsum of ends) for labels[k], cumsums padded with a leading 0.
+    """
+    labels = []
+    label_turns = {}
+    for turn, _, label in ann.itertracks(yield_label=True):
+        if label not in label_turns:
+            labels.append(label)
+            label_turns[label] = []
+        label_turns[label].append((turn.start, turn.end))
+
+    turns = []
+    for label in labels:
+        pairs = np.asarray(label_turns[label], dtype=np.float64)
+        starts = np.sort(pairs[:, 0])
+        sorted_ends = np.sort(pairs[:, 1])
+        turns.append((
+            starts,
+            np.concatenate(([0.0], np.cumsum(starts))),
+            sorted_ends,
+            np.concatenate(([0.0], np.cumsum(sorted_ends))),
+        ))
+    return labels, turns
+
+def _speaker_coverage(turns, t):
+    """
+    Total duration of a speaker's turns lying before each time in `t`:
+    sum over turns of clip(t - start, 0, end - start) = sum (t - start)^+ - (t - end)^+.
+    """
+    starts, start_cumsum, sorted_ends, end_cumsum = turns
+    n_started = np.searchsorted(starts, t, side="right")
+    n_ended = np.searchsorted(sorted_ends, t, side="right")
+    return (n_started * t - start_cumsum[n_started]) - (n_ended * t - end_cumsum[n_ended])
+
+def _crop_speaker(ann, seg):
+    """
+    The speaker overlapping `seg` the most as computed by cropping the Annotation: ties go to
+    the label itertracks yields first in the cropped Annotation.
+    """
+    durations = {}
+    for subseg, _, label in ann.crop(seg, mode="intersection").itertracks(yield_label=True):
+        durations[label] = durations.get(label, 0.0) + subseg.duration
+    return max(durations, key=durations.get) if durations else None
+
 def add_speaker_info_to_text(timestamp_texts, ann):
+    """
+    Assigns each ASR segment the speaker whose diarization turns overlap it the most
+    (None when no turn overlaps it), in O((N + M) log M) instead of cropping the
+    Annotation once per segment. Segments where several speakers come within
+    MIN_OVERLAP of the best (e.g. two speakers both covering the whole segment) are
+    cropped like before, so ties are broken exactly as the crop-based implementation does.
+    """
+    if not timestamp_texts:
+        return []
+    labels, turns = speaker_turn_arrays(ann)
+    if not labels:
+        return [(seg, None, text) for seg, text in timestamp_texts]
+
+    seg_starts = np.fromiter((seg.start for seg, _ in timestamp_texts), dtype=np.float64, count=len(timestamp_texts))
+    seg_ends = np.fromiter((seg.end for seg, _ in timestamp_texts), dtype=np.float64, count=len(timestamp_texts))
+    overlaps = np.empty((len(timestamp_texts), len(labels)), dtype=np.float64)
+    for k, label_turns in enumerate(turns):
+        overlaps[:, k] = _speaker_coverage(label_turns, seg_ends) - _speaker_coverage(label_turns, seg_starts)
+
+    best_overlap = overlaps.max(axis=1)
+    is_best = overlaps >= (best_overlap - MIN_OVERLAP)[:, None]
+    best = np.argmax(is_best, axis=1)
+
     spk_text = []
-    for seg, text in timestamp_texts:
-        cropped = ann.crop(seg, mode="intersection")
-        durations = defaultdict(float)
-        for subseg, _, label in cropped.itertracks(yield_label=True):
-            durations[label] += subseg.duration
-        if durations:
-            speaker = max(durations, key=durations.get)
-        else:
-            speaker = None
-        spk_text.append((seg, speaker, text))
+    for i, (seg, text) in enumerate(timestamp_texts):
+        if best_overlap[i] <= MIN_OVERLAP:
+            spk_text.append((seg, None, text))
+            continue
+        if np.count_nonzero(is_best[i]) > 1:
+            spk_text.append((seg, _crop_speaker(ann, seg), text))
+            continue
+        spk_text.append((seg, labels[best[i]], text))
     return spk_text
 
 def merge_cache(text_cache):
@@ -84,7 +162,7 @@ def write_to_txt(spk_sent, file):
             line = f'{seg.start:.2f} {seg.end:.2f} {spk} {sentence}\n'
             fp.write(line)
 
-def save_transcripts_json(args, output_data, file_name):
+def transcript_rows(output_data):
     serializable = []
     prev_end = 0.
     for i, item in enumerate(output_data):
@@ -100,45 +178,119 @@ def save_transcripts_json(args, output_data, file_name):
             "text":    text
         })
         prev_end = end
-    # Save speech recognition results in JSON format in two locations (frontend・backup)
-    output_dirs = ["src/frontend/public/transcripts", f"outputs/{file_name}"]
-    for output_dir in output_dirs:
-        os.makedirs(output_dir, exist_ok=True)
-        output_file_path = os.path.join(output_dir, f"{file_name}.json")
-        with open(output_file_path, "w", encoding="utf-8") as json_file:
-            json.dump(serializable, json_file, ensure_ascii=False, indent=2)
-        if output_dir == output_dirs[1]:
-            txt_file_path = os.path.join(output_dir, f"{file_name}.txt")
-            with open(txt_file_path, "w", encoding="utf-8") as txt_file:
-                for item in serializable:
-                    txt_file.write(
-                        f"{item['start']:.2f} {item['end']:.2f} {item['speaker']}:{item['text']}\n"
-                    )
-    # Copy audio
-    audio_paths = ["src/frontend/public/audios", f"outputs/{file_name}"]
-    for audio_path in audio_paths:
-        shutil.copy2(os.path.join(args.audio_dir, f"{file_name}.wav"), audio_path)
+    return serializable
+
+def save_partial_transcript_json(output_data, file_name):
+    # Transcript so far, for the frontend only; save_transcripts_json overwrites it when the file is done
+    atomic_write_text(
+        os.path.join("src/frontend/public/transcripts", f"{file_name}.json"),
+        json.dumps(transcript_rows(output_data), ensure_ascii=False, indent=2)
+    )
+
+def _transcript_paths(file_name):
+    # Frontend copy and backup
+    return [
+        os.path.join("src/frontend/public/transcripts", f"{file_name}.json"),
+        os.path.join(f"outputs/{file_name}", f"{file_name}.json"),
+    ]
+
+def _audio_paths(file_name):
+    return [
+        os.path.join("src/frontend/public/audios", f"{file_name}.wav"),
+        os.path.join(f"outputs/{file_name}", f"{file_name}.wav"),
+    ]
+
+def _peaks_paths(file_name):
+    return [
+        os.path.join("src/frontend/public/peaks", f"{file_name}.json"),
+        os.path.join(f"outputs/{file_name}", f"{file_name}.peaks.json"),
+    ]
+
+def save_transcripts_json(args, output_data, file_name):
+    serializable = transcript_rows(output_data)
+    # Save speech recognition results in JSON format in two locations (frontend・backup),
+    # serialized once and written atomically
+    json_text = json.dumps(serializable, ensure_ascii=False, indent=2)
+    publish_text(json_text, _transcript_paths(file_name))
+    publish_text(
+        "".join(
+            f"{item['start']:.2f} {item['end']:.2f} {item['speaker']}:{item['text']}\n"
+            for item in serializable
+        ),
+        [os.path.join(f"outputs/{file_name}", f"{file_name}.txt")]
+    )
+    # Place audio (linked or cloned rather than copied where the filesystem allows)
+    frontend_path, output_path = _audio_paths(file_name)
+    source = os.path.join(args.audio_dir, f"{file_name}.wav")
+    strategy = getattr(args, "audio_publish", "auto")
+    publish_audio(source, [frontend_path], strategy)
+    # The outputs/ copy is the retained one: it is only hardlinked to the source on request
+    publish_audio(source, [output_path], strategy, independent=True)
+
+def outputs_current(args, output_data, file_name):
+    """
+    Whether the transcripts, published audio and (with --peaks_per_sec) peak files of a file
+    already match output_data and the current source audio, e.g. for a result cache hit that
+    an earlier run materialized. Checked without decoding the audio.
+    """
+    source = os.path.join(args.audio_dir, f"{file_name}.wav")
+    json_text = json.dumps(transcript_rows(output_data), ensure_ascii=False, indent=2)
+    try:
+        for path in _transcript_paths(file_name):
+            with open(path, "r", encoding="utf-8") as f:
+                if f.read() != json_text:
+                    return False
+        if not os.path.exists(os.path.join(f"outputs/{file_name}", f"{file_name}.txt")):
+            return False
+        source_stat = os.stat(source)
+        for path in _audio_paths(file_name):
+            # Every publish strategy keeps the source's size and modification time
+            stat = os.stat(path)
+            if stat.st_size != source_stat.st_size or stat.st_mtime < source_stat.st_mtime:
+                return False
+    except OSError:
+        return False
+    if args.peaks_per_sec:
+        return all(peaks_current(path, source, args.peaks_per_sec) for path in _peaks_paths(file_name))
+    return True
+
+def save_peaks_json(peaks, file_name):
+    # Compact separators: the frontend fetches this before the audio, so size matters more than readability
+    publish_text(json.dumps(peaks, separators=(",", ":")), _peaks_paths(file_name))
+
+def _current_playback(source, output_path, meta_paths):
+    # Metadata of a rendition encoded after the source last changed, or None if it must be (re)encoded
+    try:
+        if os.path.getmtime(output_path) < os.path.getmtime(source):
+            return None
+        with open(meta_paths[-1], "r", encoding="utf-8") as f:
+            playback = json.load(f)["playback"]
+        if playback["file"] != os.path.basename(output_path) or not all(map(os.path.exists, meta_paths)):
+            return None
+        return playback
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def save_playback_audio(args, file_name):
+    # Compressed rendition the frontend plays instead of the WAV, described in public/meta/<name>.json
+    extension = PLAYBACK_FORMATS[args.playback_format][2]
+    source = os.path.join(args.audio_dir, f"{file_name}.wav")
+    output_path = os.path.join(f"outputs/{file_name}", f"{file_name}{extension}")
+    frontend_path = os.path.join("src/frontend/public/audios", f"{file_name}{extension}")
+    meta_paths = [
+        os.path.join("src/frontend/public/meta", f"{file_name}.json"),
+        os.path.join(f"outputs/{file_name}", f"{file_name}.meta.json"),
+    ]
+    # Reruns (e.g. of result cache hits) keep a rendition that is newer than its source
+    playback = _current_playback(source, output_path, meta_paths)
+    if playback is not None and os.path.exists(frontend_path):
+        return playback
+    if playback is None:
+        playback = encode_playback(source, output_path, args.playback_format)
+    publish_audio(output_path, [frontend_path], getattr(args, "audio_publish", "auto"))
+    publish_text(json.dumps({"audio": f"{file_name}.wav", "playback": playback}, ensure_ascii=False, indent=2), meta_paths)
+    return playback
 
 def save_index_json(file_names):
-    os.makedirs("src/frontend/public/audios", exist_ok=True)
-    index_paths = ["src/frontend/public/audios/index.json", "outputs/index.json"]
-    for index_path in index_paths:
-        if os.path.exists(index_path):
-            with open(index_path, "r", encoding="utf-8") as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError:
-                    data = []
-        else:
-            data = []
-        if isinstance(file_names, list):
-            for item in file_names:
-                if item not in data:
-                    data.append(item)
-        else:
-            if file_names not in data:
-                data.append(file_names)
-        
-        with open(index_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            f.write("\n")
+    # Queued in the process-wide index; written out (merged, atomically) shortly after
+    INDEX.add(file_names)
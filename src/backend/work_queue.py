@@ -0,0 +1,161 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from cache import atomic_write_text
+
+
+class FileWorkQueue:
+    """
+    Cooperative work queue backed only by a shared directory, so several transcribe.py
+    instances (possibly on different machines over NFS) can drain one audio directory.
+
+    queue_dir/leases/<name>.lease  exclusive claim, created with O_CREAT | O_EXCL and
+                                   kept alive by touching its mtime every heartbeat_sec
+    queue_dir/done/<name>.done     written once the file's outputs are saved
+
+    A lease whose mtime is older than lease_ttl belongs to a crashed node and is reclaimed.
+    """
+    def __init__(self, queue_dir: str, lease_ttl: float = 300.0, heartbeat_sec: float = 30.0):
+        self.lease_dir = os.path.join(queue_dir, "leases")
+        self.done_dir = os.path.join(queue_dir, "done")
+        os.makedirs(self.lease_dir, exist_ok=True)
+        os.makedirs(self.done_dir, exist_ok=True)
+        self.lease_ttl = lease_ttl
+        self.heartbeat_sec = heartbeat_sec
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._held: set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="queue-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def _lease_path(self, name: str) -> str:
+        return os.path.join(self.lease_dir, f"{name}.lease")
+
+    @staticmethod
+    def done_marker(queue_dir: str, name: str) -> str:
+        return os.path.join(queue_dir, "done", f"{name}.done")
+
+    def _done_path(self, name: str) -> str:
+        return os.path.join(self.done_dir, f"{name}.done")
+
+    def is_done(self, name: str) -> bool:
+        return os.path.exists(self._done_path(name))
+
+    def _create_exclusive(self, path: str, content: str) -> bool:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        return True
+
+    def _is_stale(self, path: str) -> bool:
+        try:
+            return time.time() - os.stat(path).st_mtime > self.lease_ttl
+        except FileNotFoundError:
+            return False
+
+    def _reclaim_stale(self, name: str) -> None:
+        """
+        Removes an expired lease. A short-lived reclaim lock makes sure only one node
+        deletes it, so a lease that was just re-created by another node is never removed.
+        """
+        lease_path = self._lease_path(name)
+        reclaim_path = lease_path + ".reclaim"
+        if self._is_stale(reclaim_path):
+            # The node reclaiming this lease died mid-way
+            try:
+                os.remove(reclaim_path)
+            except FileNotFoundError:
+                pass
+        if not self._create_exclusive(reclaim_path, self.owner):
+            return
+        try:
+            if self._is_stale(lease_path):
+                os.remove(lease_path)
+                print(f"Reclaimed expired lease on {name}")
+        finally:
+            os.remove(reclaim_path)
+
+    def claim(self, name: str) -> bool:
+        """
+        return: True if this instance now owns `name` and should process it
+        """
+        if self._stop.is_set() or self.is_done(name):
+            # Closed: a lease taken now would never be renewed or released
+            return False
+        lease_path = self._lease_path(name)
+        content = json.dumps({"owner": self.owner, "claimed": time.time()})
+        if not self._create_exclusive(lease_path, content):
+            if not self._is_stale(lease_path):
+                return False
+            self._reclaim_stale(name)
+            if not self._create_exclusive(lease_path, content):
+                return False
+        # The file may have been finished between the done check and the claim
+        if self.is_done(name):
+            os.remove(lease_path)
+            return False
+        with self._lock:
+            self._held.add(name)
+        return True
+
+    def _owns(self, name: str) -> bool:
+        try:
+            with open(self._lease_path(name), "r", encoding="utf-8") as f:
+                return json.load(f).get("owner") == self.owner
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat_sec):
+            with self._lock:
+                held = list(self._held)
+            for name in held:
+                try:
+                    if self._owns(name):
+                        os.utime(self._lease_path(name), None)
+                        continue
+                    problem = "lost the lease; another node may process it too"
+                except OSError as e:
+                    # complete()/release() may remove the lease between the check and the touch
+                    problem = f"could not renew the lease: {e}"
+                # Logged rather than raised, so the thread keeps renewing the other leases
+                with self._lock:
+                    still_held = name in self._held
+                if still_held:
+                    print(f"Warning: {name}: {problem}")
+
+    def release(self, name: str) -> None:
+        """
+        Gives `name` back to the queue without marking it done (e.g. after a failure).
+        """
+        with self._lock:
+            self._held.discard(name)
+        if self._owns(name):
+            try:
+                os.remove(self._lease_path(name))
+            except FileNotFoundError:
+                pass
+
+    def complete(self, name: str) -> None:
+        atomic_write_text(self._done_path(name), json.dumps({"owner": self.owner, "finished": time.time()}))
+        self.release(name)
+
+    def close(self) -> None:
+        """
+        Stops the heartbeat and releases every lease still held, including ones claimed ahead
+        of processing (prefetched files) that were never completed.
+        """
+        self._stop.set()
+        self._heartbeat.join()
+        with self._lock:
+            held = list(self._held)
+        for name in held:
+            self.release(name)
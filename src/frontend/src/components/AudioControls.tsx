@@ -22,6 +22,66 @@ interface AudioControlsProps {
   lastPlaybackPosition: number
 }
 
+interface PeakLevel {
+  samples_per_peak: number
+  length: number
+  data: number[]
+}
+
+interface PeakFile {
+  duration: number
+  bits: number
+  levels: PeakLevel[]
+}
+
+// Precomputed by the backend (public/peaks/<name>.json), so the waveform is painted without downloading and decoding the audio
+const loadPeaks = async (audioSrc: string, width: number) => {
+  try {
+    const response = await fetch(`/peaks/${audioSrc.replace(".wav", ".json")}`)
+    if (!response.ok) return null
+    const peakFile: PeakFile = await response.json()
+    // Coarsest level that still has at least one peak per pixel
+    const coarseFirst = [...peakFile.levels].sort((a, b) => b.samples_per_peak - a.samples_per_peak)
+    const level = coarseFirst.find((candidate) => candidate.length >= width) ?? coarseFirst[coarseFirst.length - 1]
+    const scale = 2 ** (peakFile.bits - 1)
+    const highs = new Float32Array(level.length)
+    const lows = new Float32Array(level.length)
+    for (let i = 0; i < level.length; i++) {
+      lows[i] = level.data[2 * i] / scale
+      highs[i] = level.data[2 * i + 1] / scale
+    }
+    // Two channels are drawn as the upper and lower half of one waveform
+    return { peaks: [highs, lows], duration: peakFile.duration }
+  } catch (error) {
+    console.warn("No precomputed peaks, decoding audio instead:", error)
+    return null
+  }
+}
+
+interface AudioMeta {
+  audio: string
+  playback?: {
+    file: string
+    mime: string
+  }
+}
+
+// Compressed rendition written by the backend (--playback_format), if the browser can play it
+const playbackUrl = async (audioSrc: string) => {
+  try {
+    const response = await fetch(`/meta/${audioSrc.replace(".wav", ".json")}`)
+    if (response.ok) {
+      const meta: AudioMeta = await response.json()
+      if (meta.playback && document.createElement("audio").canPlayType(meta.playback.mime) !== "") {
+        return `/audios/${meta.playback.file}`
+      }
+    }
+  } catch (error) {
+    console.warn("No playback rendition, using the original audio:", error)
+  }
+  return `/audios/${audioSrc}`
+}
+
 const AudioControls: React.FC<AudioControlsProps> = ({
   currentTime,
   duration,
@@ -117,8 +177,14 @@ const AudioControls: React.FC<AudioControlsProps> = ({
         })
 
         if (audioSrc) {
-          console.log("Loading audio:", `/audios/${audioSrc}`)
-          wavesurferRef.current.load(`/audios/${audioSrc}`)
+          const width = (waveformRef.current?.clientWidth || 1000) * (window.devicePixelRatio || 1)
+          const [url, peakData] = await Promise.all([playbackUrl(audioSrc), loadPeaks(audioSrc, width)])
+          console.log("Loading audio:", url)
+          if (peakData) {
+            wavesurferRef.current.load(url, peakData.peaks, peakData.duration)
+          } else {
+            wavesurferRef.current.load(url)
+          }
         }
 
         isInitializedRef.current = true